@@ -0,0 +1,109 @@
+# bench_tracing.py
+# Measures the overhead of request timing instrumentation against a local server, and
+# what the trace hooks cost per request on their own, without the network.
+# Usage: python bench_tracing.py [requests] [concurrency] [server_latency_ms]
+import asyncio
+import statistics
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.tracing import Trace
+from multidict import CIMultiDict
+from yarl import URL
+
+import scraper
+from tracing import request_timings, timed
+
+BODY = b"x" * 4096
+server_latency = 0.0
+
+
+async def handle(request):
+    if server_latency:
+        await asyncio.sleep(server_latency)
+    return web.Response(body=BODY, content_type="text/html")
+
+
+async def run(port, total, concurrency, traced):
+    request_timings.reset()
+    request_timings.enabled = traced
+    trace_configs = [request_timings.trace_config()] if traced else []
+    url = f"http://127.0.0.1:{port}/"
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await scraper.fetch(session, url)
+
+    async with aiohttp.ClientSession(trace_configs=trace_configs) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(total)])
+        return time.perf_counter() - start
+
+
+async def hook_cost(trace_config, total, traced):
+    """
+    Seconds per request spent in the trace dispatch aiohttp does for a request over a pooled
+    connection, plus the scraper's own timed() phases. No network, so the number is stable.
+    """
+    request_timings.enabled = traced
+    trace_config.freeze() # As ClientSession does
+    url, headers = URL("http://127.0.0.1/"), CIMultiDict()
+    start = time.perf_counter()
+    for _ in range(total):
+        trace = Trace(None, trace_config, trace_config.trace_config_ctx())
+        with timed(request_timings, "127.0.0.1", "rate_limit_wait"):
+            pass
+        await trace.send_request_start("GET", url, headers)
+        await trace.send_connection_reuseconn()
+        await trace.send_request_headers("GET", url, headers)
+        await trace.send_response_chunk_received("GET", url, BODY)
+        await trace.send_request_end("GET", url, headers, None)
+        with timed(request_timings, "127.0.0.1", "body"):
+            pass
+    return (time.perf_counter() - start) / total
+
+
+async def main():
+    global server_latency
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    server_latency = (float(sys.argv[3]) if len(sys.argv) > 3 else 0.0) / 1000
+    scraper.rate_limiter.delay = 0 # Measure the request path, not the politeness delay
+
+    app = web.Application()
+    app.router.add_get("/", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    try:
+        await run(port, total // 10, concurrency, traced=False) # Warm up
+        plain, traced = [], []
+        for _ in range(7):
+            plain.append(await run(port, total, concurrency, traced=False))
+            traced.append(await run(port, total, concurrency, traced=True))
+    finally:
+        await runner.cleanup()
+
+    dispatch = min([await hook_cost(aiohttp.TraceConfig(), total, traced=False) for _ in range(5)])
+    hooks = min([await hook_cost(request_timings.trace_config(), total, traced=True) for _ in range(5)])
+
+    # With no server latency a loopback request takes a few hundred microseconds, so
+    # the relative overhead is a worst case; the absolute cost per request carries over.
+    median_plain, median_traced = statistics.median(plain), statistics.median(traced)
+    overhead = (median_traced - median_plain) / median_plain * 100
+    per_request = (median_traced - median_plain) / total * 1_000_000
+    print(f"Without tracing: {total / median_plain:,.0f} req/s")
+    print(f"With tracing:    {total / median_traced:,.0f} req/s")
+    print(f"Overhead: {overhead:.2f}% ({per_request:.1f}us per request)")
+    print(f"Per request without the network: {dispatch * 1_000_000:.1f}us of aiohttp trace dispatch, "
+          f"{(hooks - dispatch) * 1_000_000:.1f}us more with the timing hooks and phases")
+    print(request_timings.format_summary())
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,14 +2,18 @@ from tqdm import tqdm
 import asyncio
 import aiohttp
 import csv
+import sys
 from utils import fetch_with_retries
+from tracing import request_timings, report_periodically
+
+PREVIEW_CHARS = 100 # Only this much of each page ends up in results.csv
 
 def save_to_csv(results):
     with open("results.csv", "w", newline="") as fs:
         writer = csv.writer(fs)
         writer.writerow(["url", "Content"])
         for url, content in results:
-            writer.writerow([url, (content or "")[:100]])
+            writer.writerow([url, (content or "")[:PREVIEW_CHARS]])
 
 async def main():
     urls = [
@@ -25,10 +29,18 @@ async def main():
         "https://www.imdb.com/chart/top",
     ]
 
-    async with aiohttp.ClientSession() as session:
+    # Pass --timings to record per-host request phases and export them to timings.json
+    trace_configs = []
+    report_task = None
+    if "--timings" in sys.argv:
+        request_timings.enabled = True
+        trace_configs.append(request_timings.trace_config())
+        report_task = asyncio.create_task(report_periodically(request_timings, interval=10))
+
+    async with aiohttp.ClientSession(trace_configs=trace_configs) as session:
         tasks = []
         for url in urls:
-            task = asyncio.create_task(fetch_with_retries(session, url, 3))
+            task = asyncio.create_task(fetch_with_retries(session, url, 3, stream=True, max_chars=PREVIEW_CHARS))
             tasks.append((task, url))
 
         results = []
@@ -53,5 +65,11 @@ async def main():
 
     save_to_csv(results)
 
+    if report_task:
+        report_task.cancel()
+        print("\n--- Request timings ---")
+        print(request_timings.format_summary())
+        request_timings.export_json("timings.json")
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -5,6 +5,7 @@ from urllib.parse import urlparse
 from collections import defaultdict
 import time
 import re
+from tracing import request_timings, timed
 
 # This class will now handle parsing and rule checking for robots.txt
 class SimplifiedRobotsParser:
@@ -202,7 +203,8 @@ class RobotTextCache:
         parser_instance, last_fetched_time = self._cache[netloc] # Using self._cache[netloc] relies on defaultdict
 
         if parser_instance is None or (time.time() - last_fetched_time) > 3600:
-            parser_instance = await self._fetch_robot_txt(session, netloc)
+            with timed(request_timings, parsed_url.hostname or netloc, "robots_wait"):
+                parser_instance = await self._fetch_robot_txt(session, netloc)
         
         # At this point, parser_instance should never be None due to _fetch_robot_txt logic
         if not parser_instance:
@@ -1,7 +1,9 @@
 import urllib.parse
 from collections import defaultdict
 import asyncio
+import codecs
 import time
+from tracing import request_timings, timed
 
 class RateLimiter:
     def __init__(self, delay = 2):
@@ -17,13 +19,74 @@ class RateLimiter:
 
 rate_limiter = RateLimiter(delay=2)
 
-async def fetch(session, url):
-    domain = urllib.parse.urlparse(url).netloc
-    await rate_limiter.wait(domain)
+# Limits for streaming fetches
+MAX_BODY_SIZE = 5 * 1024 * 1024 # Bytes; larger bodies are cut off (or refused up front via Content-Length)
+CHUNK_SIZE = 64 * 1024
+TEXT_CONTENT_TYPES = ("text/", "application/xhtml+xml", "application/xml", "application/json")
+
+def is_text_content_type(content_type: str) -> bool:
+    return content_type.startswith(TEXT_CONTENT_TYPES) or content_type.endswith(("+xml", "+json"))
+
+async def read_text_streaming(response, url, max_bytes=MAX_BODY_SIZE, max_chars=None):
+    """
+    Reads and decodes the response body chunk by chunk.
+    Returns None for non-text responses without reading the body, and for oversized ones (per
+    Content-Length) when the whole body is wanted. Stops after max_bytes, and as soon as
+    max_chars characters have been decoded, so a prefix of a large page can still be read.
+    """
+    content_type = response.content_type or ""
+    if not is_text_content_type(content_type):
+        print(f"Skipping {url}: non-text content type '{content_type}'")
+        return None
+
+    if max_chars is None and response.content_length is not None and response.content_length > max_bytes:
+        print(f"Skipping {url}: Content-Length {response.content_length} exceeds limit of {max_bytes} bytes")
+        return None
+
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    parts = []
+    chars = 0
+    received = 0
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        if received + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - received]
+        received += len(chunk)
+        text = decoder.decode(chunk)
+        parts.append(text)
+        chars += len(text)
+
+        if max_chars is not None and chars >= max_chars:
+            break # The consumer has what it needs; the connection is dropped on release
+        if received >= max_bytes:
+            print(f"Truncated {url} at {max_bytes} bytes")
+            break
+    else:
+        parts.append(decoder.decode(b"", final=True))
+
+    text = "".join(parts)
+    return text[:max_chars] if max_chars is not None else text
+
+async def fetch(session, url, stream=False, max_bytes=MAX_BODY_SIZE, max_chars=None):
+    """
+    Fetches url and returns its text, or None on error.
+    With stream=True the body is read incrementally through read_text_streaming.
+    """
+    parsed_url = urllib.parse.urlparse(url)
+    domain = parsed_url.netloc
+    host = parsed_url.hostname or url
+    with timed(request_timings, host, "rate_limit_wait"):
+        await rate_limiter.wait(domain)
 
     try:
         async with session.get(url) as response:
-            return await response.text()
+            with timed(request_timings, host, "body"):
+                if stream:
+                    return await read_text_streaming(response, url, max_bytes, max_chars)
+                return await response.text()
     
     except Exception as e:
         print(f"Error fetching {url}: {e}")
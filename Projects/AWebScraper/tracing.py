@@ -0,0 +1,194 @@
+# tracing.py
+import asyncio
+import json
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import aiohttp
+
+# Phases recorded for every request. 'connect' covers the TCP connect and, for
+# https URLs, the TLS handshake: aiohttp fires a single hook around both.
+PHASES = ("dns", "connect", "ttfb", "body", "total", "rate_limit_wait", "robots_wait")
+
+
+class Histogram:
+    """
+    HDR-style log-linear histogram of durations in microseconds.
+    Every power of two is split into SUB_BUCKETS linear buckets, so any recorded
+    value is reported with a relative error of at most 1 / SUB_BUCKETS.
+    Recording is a couple of integer operations and one list increment.
+    """
+    SUB_BUCKET_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    MAX_EXPONENT = 40 # 2**40 us is ~12 days, anything above is clamped
+
+    def __init__(self):
+        self.counts = [0] * ((self.MAX_EXPONENT + 1) * self.SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.SUB_BUCKETS:
+            return value # Values below SUB_BUCKETS get an exact bucket each
+        exponent = value.bit_length() - self.SUB_BUCKET_BITS
+        if exponent > self.MAX_EXPONENT:
+            return len(self.counts) - 1
+        sub_bucket = (value >> (exponent - 1)) - self.SUB_BUCKETS
+        return exponent * self.SUB_BUCKETS + sub_bucket
+
+    def _bucket_value(self, index):
+        """Returns the upper bound of the given bucket, in microseconds."""
+        exponent, sub_bucket = divmod(index, self.SUB_BUCKETS)
+        if exponent == 0:
+            return sub_bucket
+        return ((self.SUB_BUCKETS + sub_bucket + 1) << (exponent - 1)) - 1
+
+    def record(self, seconds):
+        value = int(seconds * 1_000_000)
+        if value < 0:
+            value = 0
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """Returns the value (in seconds) below which pct percent of recordings fall."""
+        if not self.count:
+            return 0.0
+        target = max(1, int(self.count * pct / 100 + 0.5))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(self._bucket_value(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": (self.total / self.count / 1_000_000) if self.count else 0.0,
+            "min": (self.min or 0) / 1_000_000,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max / 1_000_000,
+        }
+
+
+class RequestTimings:
+    """Per-host, per-phase latency histograms fed by aiohttp trace hooks and the scraper."""
+    def __init__(self, enabled=True):
+        # Format: { 'host': { 'phase': Histogram } }
+        self.hosts = defaultdict(lambda: defaultdict(Histogram))
+        self.enabled = enabled
+
+    def record(self, host, phase, seconds):
+        if self.enabled:
+            self.hosts[host][phase].record(seconds)
+
+    def summary(self):
+        return {
+            host: {phase: phases[phase].snapshot() for phase in PHASES if phase in phases}
+            for host, phases in self.hosts.items()
+        }
+
+    def format_summary(self):
+        lines = []
+        for host, phases in self.summary().items():
+            parts = [
+                f"{phase} p50={stats['p50'] * 1000:.1f}ms p99={stats['p99'] * 1000:.1f}ms"
+                for phase, stats in phases.items()
+            ]
+            lines.append(f"  {host}: " + ", ".join(parts))
+        return "\n".join(lines)
+
+    def export_json(self, path):
+        with open(path, "w") as fs:
+            json.dump({"generated_at": time.time(), "hosts": self.summary()}, fs, indent=2)
+
+    def reset(self):
+        self.hosts.clear()
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """
+        Builds a TraceConfig that records dns, connect, ttfb and total time per request.
+        Only two hooks run for every request; the dns and connect ones fire only when a
+        lookup or a new connection is needed. ttfb is therefore the total minus the time
+        spent on those, rather than timed from on_request_headers_sent, which would cost
+        a third dispatch per request.
+        """
+        timings = self
+
+        async def on_request_start(session, ctx, params):
+            ctx.host = params.url.host
+            ctx.setup = 0.0 # dns and connect time spent by this request
+            ctx.start = time.perf_counter()
+
+        async def on_dns_resolvehost_start(session, ctx, params):
+            ctx.dns_start = time.perf_counter()
+
+        async def on_dns_resolvehost_end(session, ctx, params):
+            elapsed = time.perf_counter() - ctx.dns_start
+            ctx.setup += elapsed
+            timings.record(params.host, "dns", elapsed)
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_start = time.perf_counter()
+
+        async def on_connection_create_end(session, ctx, params):
+            elapsed = time.perf_counter() - ctx.connect_start
+            ctx.setup += elapsed
+            timings.record(ctx.host, "connect", elapsed)
+
+        async def on_request_end(session, ctx, params):
+            total = time.perf_counter() - ctx.start
+            timings.record(ctx.host, "ttfb", total - ctx.setup)
+            # 'total' here ends at the response headers; the body is timed by the caller
+            timings.record(ctx.host, "total", total)
+
+        trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=SimpleNamespace)
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+
+class timed:
+    """Context manager that records the time spent inside it as one phase for one host."""
+    __slots__ = ("timings", "host", "phase", "start")
+
+    def __init__(self, timings, host, phase):
+        self.timings = timings
+        self.host = host # As in the trace hooks: the hostname without port
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.timings.enabled:
+            self.timings.record(self.host, self.phase, time.perf_counter() - self.start)
+        return False
+
+
+async def report_periodically(timings: RequestTimings, interval: float = 10.0):
+    """Prints a per-host summary every interval seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        if timings.hosts:
+            print(f"\n--- Request timings ({interval:.0f}s) ---")
+            print(timings.format_summary())
+
+# Global instance, disabled until a crawl opts in
+request_timings = RequestTimings(enabled=False)
@@ -10,10 +10,10 @@ async def backoff_delay(attempt: int, baseDelay: float = 1.0, maxDelay: float =
     
     return min(delay, maxDelay)
 
-async def fetch_with_retries(session, url, retries):
+async def fetch_with_retries(session, url, retries, **fetch_kwargs):
     for attempt in range(retries):
         try:
-            return await fetch(session, url)
+            return await fetch(session, url, **fetch_kwargs)
         except Exception:
             if attempt < retries - 1:
                 delay = backoff_delay(attempt)
@@ -1,70 +1,117 @@
 import asyncio
 import aiofiles
 import aiohttp
-from tqdm.asyncio import tqdm
-import sys
+import argparse
 import os
+import json
+
+from progress import RENDER_INTERVAL, Progress
+
+STOP = None # Queue sentinel: the worker that takes it exits
+DRAIN_DEADLINE = 5.0 # Seconds in-flight downloads get to finish on stop before they're checkpointed
+CHECKPOINT_FILE = "downloads.checkpoint.json"
+CHUNK_SIZE = 1024 * 1024
 
 class DownloadManager:
-    def __init__(self):
-        self.downloads = {}  # {filename: {'url': url, 'task': task, 'event': event, 'status': 'pending'/'downloading'/'paused'/'completed'/'failed'}}
-        self.active_downloads_limit = 3 # Limit concurrent downloads (adjust as needed)
+    def __init__(self, checkpoint_path=None, progress=None):
+        self.downloads = {}  # {filename: {'url': url, 'task': task, 'event': event, 'offset': bytes written, 'status': 'pending'/'downloading'/'paused'/'completed'/'failed'/'checkpointed'}}
+        self.active_downloads_limit = 3 # Limit concurrent downloads (adjust as needed, or scale() at runtime)
         self.active_downloads_count = 0
         self.queue = asyncio.Queue() # To manage downloads when limit is active
         self.stop_event = asyncio.Event() # To signal the main loop to stop
+        self.drain_deadline = DRAIN_DEADLINE
+        self.checkpoint_path = checkpoint_path # Where unfinished downloads are saved on stop, if anywhere
+        self.worker_tasks = set()
+        self.idle_workers = set() # Workers waiting on the queue; cancelling them loses nothing
+        self.retiring = 0 # Busy workers to retire after their current download (scaling down)
+        self.progress = progress or Progress() # One view of every download, drawn by a single task
 
     async def _worker(self):
-        """Worker to process downloads from the queue."""
-        while not self.stop_event.is_set():
-            try:
-                filename = await asyncio.wait_for(self.queue.get(), timeout=1.0) # Small timeout to check stop_event
-            except asyncio.TimeoutError:
-                continue # No items in queue, check stop_event again
+        """Worker to process downloads from the queue until it takes STOP, is retired or cancelled."""
+        task = asyncio.current_task()
+        try:
+            while not self.retiring:
+                self.idle_workers.add(task)
+                try:
+                    filename = await self.queue.get() # Sleeps until there is work; no polling
+                finally:
+                    self.idle_workers.discard(task)
+                try:
+                    if filename is STOP:
+                        return
+                    await self._download(filename)
+                finally:
+                    self.queue.task_done() # Mark task as done in the queue
+            self.retiring -= 1
+        finally:
+            self.worker_tasks.discard(task)
 
-            if self.stop_event.is_set():
-                break # Exit if stop signal received
+    async def _download(self, filename):
+        dl_info = self.downloads[filename]
+        url = dl_info['url']
+        event = dl_info['event']
+        offset = dl_info['offset']
+        transfer = None
 
-            dl_info = self.downloads[filename]
-            url = dl_info['url']
-            event = dl_info['event']
+        self.active_downloads_count += 1
+        dl_info['status'] = 'downloading'
+        dl_info['task'] = asyncio.current_task()
+        print(f"\n[Manager] {'Resuming' if offset else 'Starting'} download: {filename}")
 
-            self.active_downloads_count += 1
-            dl_info['status'] = 'downloading'
-            print(f"\n[Manager] Starting download: {filename}")
-
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url) as response:
+        try:
+            headers = {'Range': f'bytes={offset}-'} if offset else None
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 200 or (response.status == 206 and offset):
                         if response.status == 200:
-                            size = int(response.content_length)
-                            async with aiofiles.open(filename, "wb") as fs:
-                                with tqdm(total=size, unit='B', unit_scale=True, desc=f"Downloading {filename}") as progress_bar:
-                                    while True:
-                                        await event.wait() # Await the individual download's event
-                                        chunk = await response.content.read(1024*1024)
-                                        if not chunk:
-                                            break
-                                        await fs.write(chunk)
-                                        progress_bar.update(len(chunk))
-                            print(f"\n[Manager] Downloaded file: {filename}")
-                            dl_info['status'] = 'completed'
-                        else:
-                            print(f"\n[Manager] Failed to download {url} (HTTP {response.status}) for {filename}")
-                            dl_info['status'] = 'failed'
-            except aiohttp.client_exceptions.ServerDisconnectedError:
-                print(f"\n[Manager] Server disconnected while downloading {filename}. Retrying or handling error.")
-                dl_info['status'] = 'failed' # Or implement retry logic
-            except aiohttp.ClientConnectionError:
-                print(f"\n[Manager] Connection error while downloading {filename}. Retrying or handling error.")
-                dl_info['status'] = 'failed' # Or implement retry logic
-            except Exception as e:
-                print(f"\n[Manager] An unexpected error occurred during download of {filename}: {e}")
-                dl_info['status'] = 'failed'
-            finally:
-                self.active_downloads_count -= 1
-                self.queue.task_done() # Mark task as done in the queue
-
-    async def add_download(self, filename, url):
+                            offset = dl_info['offset'] = 0 # The server sent the whole file; start over
+                        size = offset + int(response.content_length)
+                        # Resume in place; a cancelled write may have got past the checkpoint, so cut it back
+                        async with aiofiles.open(filename, "r+b" if offset else "wb") as fs:
+                            if offset:
+                                await fs.seek(offset)
+                                await fs.truncate()
+                            transfer = self.progress.add(filename, size, offset)
+                            while True:
+                                await event.wait() # Await the individual download's event
+                                chunk = await response.content.read(CHUNK_SIZE)
+                                if not chunk:
+                                    break
+                                await fs.write(chunk)
+                                dl_info['offset'] += len(chunk)
+                                transfer.done += len(chunk) # The renderer picks it up on its next refresh
+                        print(f"\n[Manager] Downloaded file: {filename}")
+                        dl_info['status'] = 'completed'
+                    else:
+                        print(f"\n[Manager] Failed to download {url} (HTTP {response.status}) for {filename}")
+                        dl_info['status'] = 'failed'
+        except asyncio.CancelledError:
+            # Stopped past the drain deadline: keep what we have so the download can resume later
+            dl_info['status'] = 'checkpointed'
+            print(f"\n[Manager] Checkpointed {filename} at {dl_info['offset']} bytes")
+            raise
+        except aiohttp.client_exceptions.ServerDisconnectedError:
+            print(f"\n[Manager] Server disconnected while downloading {filename}. Retrying or handling error.")
+            dl_info['status'] = 'failed' # Or implement retry logic
+        except aiohttp.ClientConnectionError:
+            print(f"\n[Manager] Connection error while downloading {filename}. Retrying or handling error.")
+            dl_info['status'] = 'failed' # Or implement retry logic
+        except FileNotFoundError:
+            # The partial file of a checkpointed download is gone; fetch it all again
+            print(f"\n[Manager] Partial file {filename} is missing, starting over.")
+            dl_info['offset'] = 0
+            dl_info['status'] = 'pending'
+            self.queue.put_nowait(filename)
+        except Exception as e:
+            print(f"\n[Manager] An unexpected error occurred during download of {filename}: {e}")
+            dl_info['status'] = 'failed'
+        finally:
+            if transfer is not None:
+                transfer.finish(dl_info['status'])
+            dl_info['task'] = None
+            self.active_downloads_count -= 1
+
+    async def add_download(self, filename, url, offset=0):
         if filename in self.downloads:
             print(f"Error: Download '{filename}' already exists.")
             return
@@ -73,13 +120,13 @@ class DownloadManager:
         event.set() # Downloads start unpaused by default
         self.downloads[filename] = {
             'url': url,
-            'task': None, # Worker will handle the task, no need to store here initially
+            'task': None, # Set by the worker while it downloads
             'event': event,
+            'offset': offset, # Resume from here, e.g. after a checkpoint
             'status': 'pending'
         }
         await self.queue.put(filename)
         print(f"Added '{filename}' to download queue.")
-
     def pause_download(self, filename):
         if filename not in self.downloads:
             print(f"Error: Download '{filename}' not found.")
@@ -90,6 +137,7 @@ class DownloadManager:
         
         self.downloads[filename]['event'].clear()
         self.downloads[filename]['status'] = 'paused'
+        self._show_status(filename, 'paused')
         print(f"Paused download: {filename}")
 
     def resume_download(self, filename):
@@ -102,8 +150,14 @@ class DownloadManager:
 
         self.downloads[filename]['event'].set()
         self.downloads[filename]['status'] = 'downloading' # Assuming it will resume downloading
+        self._show_status(filename, 'downloading')
         print(f"Resumed download: {filename}")
 
+    def _show_status(self, filename, status):
+        transfer = self.progress.transfers.get(filename)
+        if transfer is not None and not transfer.finished:
+            transfer.status = status
+
     def get_status(self):
         if not self.downloads:
             print("No downloads in progress.")
@@ -113,28 +167,88 @@ class DownloadManager:
             print(f"  {filename}: {info['status']} (URL: {info['url']})")
         print("-----------------------\n")
 
+    def scale(self, count):
+        """
+        Runs count workers from now on. New workers start right away; when scaling down,
+        idle workers are cancelled first and busy ones retire after their current download.
+        """
+        self.active_downloads_limit = count
+        for _ in range(count - len(self.worker_tasks)):
+            task = asyncio.create_task(self._worker())
+            self.worker_tasks.add(task)
+        excess = len(self.worker_tasks) - count
+        for task in list(self.idle_workers)[:max(0, excess)]:
+            task.cancel()
+            self.idle_workers.discard(task)
+            self.worker_tasks.discard(task)
+            excess -= 1
+        self.retiring = max(0, excess)
+        print(f"Running {count} download workers.")
+
+    def stop(self, deadline=DRAIN_DEADLINE):
+        """Asks start() to shut down, giving in-flight downloads deadline seconds (None waits for them)."""
+        self.drain_deadline = deadline
+        self.stop_event.set()
+
+    async def shutdown(self, deadline=DRAIN_DEADLINE):
+        """
+        Stops the workers. Queued downloads aren't started and stay pending, in-flight ones
+        get deadline seconds to finish and are cancelled and checkpointed after that.
+        """
+        while not self.queue.empty():
+            self.queue.get_nowait() # Its entry in self.downloads stays 'pending'
+            self.queue.task_done()
+        self.retiring = 0
+        workers = list(self.worker_tasks)
+        for _ in workers:
+            self.queue.put_nowait(STOP) # Idle workers take it at once, busy ones after their download
+        if workers:
+            _, running = await asyncio.wait(workers, timeout=deadline)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        if self.checkpoint_path:
+            self.save_checkpoint()
+
+    def save_checkpoint(self):
+        """Writes every unfinished download, with how far it got, to checkpoint_path."""
+        unfinished = {
+            filename: {'url': info['url'], 'offset': info['offset']}
+            for filename, info in self.downloads.items() if info['status'] not in ('completed', 'failed')
+        }
+        with open(self.checkpoint_path, "w") as fs:
+            json.dump(unfinished, fs, indent=2)
+        print(f"Saved {len(unfinished)} unfinished downloads to {self.checkpoint_path}")
+
+    async def load_checkpoint(self):
+        """Queues the downloads saved by save_checkpoint(), resuming each where it stopped. Returns how many."""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as fs:
+            unfinished = json.load(fs)
+        for filename, info in unfinished.items():
+            await self.add_download(filename, info['url'], info['offset'])
+        return len(unfinished)
+
     async def start(self):
-        # Start worker tasks
-        self.worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.active_downloads_limit)]
+        # Start worker tasks and the progress view
+        self.progress.start()
+        self.scale(self.active_downloads_limit)
         # Initial downloads can be added here, or via user command later
         
         # Keep the manager running until explicitly told to stop
         await self.stop_event.wait() 
         
-        # Signal workers to stop
-        for _ in self.worker_tasks:
-            self.stop_event.set() # Set for each worker
-        await asyncio.gather(*self.worker_tasks) # Wait for workers to finish
+        await self.shutdown(self.drain_deadline)
+        await self.progress.stop()
         print("Download manager stopped.")
 
 
 async def take_command(manager: DownloadManager):
     print("Welcome to the Async Download Manager!")
-    print("Commands: add <filename> <url>, pause <filename>, resume <filename>, status, stop")
+    print("Commands: add <filename> <url>, pause <filename>, resume <filename>, workers <count>, status, stop [seconds]")
     while not manager.stop_event.is_set():
-        sys.stdout.write("Enter command > ")
-        sys.stdout.flush()
-        command_line = await asyncio.to_thread(sys.stdin.readline)
+        command_line = await manager.progress.input("Enter command > ")
         command_line = command_line.strip()
         parts = command_line.split()
 
@@ -162,23 +276,37 @@ async def take_command(manager: DownloadManager):
                 manager.resume_download(filename)
             else:
                 print("Usage: resume <filename>")
+        elif command == "workers":
+            if len(parts) == 2 and parts[1].isdigit():
+                manager.scale(int(parts[1]))
+            else:
+                print("Usage: workers <count>")
         elif command == "status":
             manager.get_status()
         elif command == "stop":
-            print("Stopping download manager...")
-            manager.stop_event.set() # Signal manager to stop
+            # In-flight downloads get this long to finish before they're checkpointed
+            try:
+                deadline = float(parts[1]) if len(parts) == 2 else DRAIN_DEADLINE
+            except ValueError:
+                deadline = None
+            if len(parts) > 2 or deadline is None or not 0 <= deadline < float("inf"):
+                print("Usage: stop [seconds]")
+                continue
+            print(f"Stopping download manager (checkpointing downloads still running after {deadline}s)...")
+            manager.stop(deadline) # Signal manager to stop
             break
         else:
             print("Unknown command. Type 'help' for options.")
 
-async def main():
-    manager = DownloadManager()
+async def main(progress=None):
+    manager = DownloadManager(checkpoint_path=CHECKPOINT_FILE, progress=progress)
 
-    # Add some initial files to download
-    await manager.add_download("test1.bin", "https://ash-speed.hetzner.com/100MB.bin")
-    await manager.add_download("test2.bin", "https://fsn1-speed.hetzner.com/100MB.bin")
-    await manager.add_download("test3.bin", "https://fsn1-speed.hetzner.com/1GB.bin")
-    await manager.add_download("test4.bin", "https://fsn1-speed.hetzner.com/50MB.bin")
+    # Pick up where the last run was stopped, or add some initial files to download
+    if not await manager.load_checkpoint():
+        await manager.add_download("test1.bin", "https://ash-speed.hetzner.com/100MB.bin")
+        await manager.add_download("test2.bin", "https://fsn1-speed.hetzner.com/100MB.bin")
+        await manager.add_download("test3.bin", "https://fsn1-speed.hetzner.com/1GB.bin")
+        await manager.add_download("test4.bin", "https://fsn1-speed.hetzner.com/50MB.bin")
 
 
     # Start the command listener and the download manager
@@ -189,11 +317,20 @@ async def main():
     await asyncio.gather(command_task, manager_task)
     print("All tasks finished.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Async download manager")
+    parser.add_argument("--headless", action="store_true", help="print progress as JSON lines instead of drawing it")
+    parser.add_argument("--progress-interval", type=float, default=RENDER_INTERVAL, help="seconds between progress updates")
+    parser.add_argument("--progress-output", help="append progress (JSON lines with --headless) to this file instead of stderr")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    # Clean up previous downloads if they exist for testing
+    args = parse_args()
+    stream = open(args.progress_output, "a", buffering=1) if args.progress_output else None
+    # Clean up previous downloads if they exist for testing, unless a checkpoint resumes them
     for f in ["test1.bin", "test2.bin", "test3.bin", "test4.bin"]:
-        if os.path.exists(f):
+        if os.path.exists(f) and not os.path.exists(CHECKPOINT_FILE):
             os.remove(f)
             print(f"Removed old {f}")
 
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(Progress(args.headless, args.progress_interval, stream)))
\ No newline at end of file
@@ -1,25 +1,28 @@
 import asyncio
 import aiofiles
 import aiohttp
-from tqdm.asyncio import tqdm
-import sys
+import argparse
+
+from progress import RENDER_INTERVAL, Progress
 
 async def download(url, filename, event):
+    transfer = None
     try:
         async with aiohttp.ClientSession() as session:
             async with session.get(url) as response:
                 if response.status == 200:
                     size = int(response.content_length)
+                    transfer = progress.add(filename, size)
                     async with aiofiles.open(filename, "wb") as fs:
-                        with tqdm(total=size, unit='B', unit_scale=True, desc=f"Downloading {filename}") as progress_bar:
-                            while True:
-                                await event.wait()
-                                chunk = await response.content.read(1024)
-                                if not chunk:
-                                    break
-                                await fs.write(chunk)
-                                progress_bar.update(len(chunk))
+                        while True:
+                            await event.wait()
+                            chunk = await response.content.read(1024)
+                            if not chunk:
+                                break
+                            await fs.write(chunk)
+                            transfer.done += len(chunk) # Drawn by the progress task, not here
                     
+                    transfer.finish("completed")
                     print(f"Downloaded file {filename}")
                 else:
                     print(f"Failed to download {url} : {response.status}")
@@ -32,14 +35,16 @@ async def download(url, filename, event):
         # Implement retry logic here
     except Exception as e:
         print(f"An unexpected error occurred during download of {url}: {e}")
+    finally:
+        if transfer is not None and not transfer.finished:
+            transfer.finish("failed")
 
 pause_event = asyncio.Event()
+progress = Progress() # Replaced from the command line options in __main__
 async def take_command():
     global pause_event
     while True:
-        sys.stdout.write("Command :- ")
-        sys.stdout.flush()
-        message = await asyncio.to_thread(sys.stdin.readline)
+        message = await progress.input("Command :- ")
         if message.strip() == "1": 
             print("Resuming downloads...")
             pause_event.set()  
@@ -52,6 +57,7 @@ files_url = {"test1.bin":["https://ash-speed.hetzner.com/100MB.bin", pause_event
 
 
 async def main():
+    progress.start()
     tasks = []
     for filename, [file_url, event] in files_url.items():
         task = asyncio.create_task(download(file_url, filename, event)) 
@@ -61,5 +67,12 @@ async def main():
     await asyncio.gather(*tasks, task_commmand)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pausable async downloader")
+    parser.add_argument("--headless", action="store_true", help="print progress as JSON lines instead of drawing it")
+    parser.add_argument("--progress-interval", type=float, default=RENDER_INTERVAL, help="seconds between progress updates")
+    parser.add_argument("--progress-output", help="append progress (JSON lines with --headless) to this file instead of stderr")
+    args = parser.parse_args()
+    stream = open(args.progress_output, "a", buffering=1) if args.progress_output else None
+    progress = Progress(args.headless, args.progress_interval, stream)
     asyncio.run(main())
                     
@@ -0,0 +1,219 @@
+# progress.py
+# Progress of many concurrent downloads without a progress bar per download. Workers only
+# bump transfer.done (one attribute add per chunk); a single renderer task looks at all
+# transfers every interval seconds and redraws one aggregated view on stderr: a line per
+# active file with its throughput and ETA, plus a total line. In headless mode it prints
+# the same numbers as one JSON object per interval instead, for scripts driving the downloader.
+# Both stay off stdout, which has the downloader's own messages and command prompt.
+import asyncio
+import json
+import shutil
+import sys
+import time
+
+RENDER_INTERVAL = 0.5
+MAX_ROWS = 10 # Active files shown individually; the rest are summed up in one line
+SMOOTHING = 0.3 # Weight of the latest interval in the throughput averages
+NAME_WIDTH = 30
+
+class Transfer:
+    """One download's counters. Workers update done and call finish(); the renderer reads them."""
+    __slots__ = ("name", "total", "done", "status", "finished", "rate", "last_done")
+
+    def __init__(self, name, total=None, done=0):
+        self.name = name
+        self.total = total # None if the server didn't say
+        self.done = done
+        self.status = "downloading"
+        self.finished = False
+        self.rate = 0.0 # Bytes per second, smoothed
+        self.last_done = done # done at the previous refresh
+
+    def finish(self, status):
+        self.status = status
+        self.finished = True
+
+    def eta(self):
+        if self.total is None or not self.rate:
+            return None
+        return max(0, self.total - self.done) / self.rate
+
+class Progress:
+    def __init__(self, headless=False, interval=RENDER_INTERVAL, stream=None):
+        self.headless = headless
+        self.interval = interval
+        self.stream = stream # Default: stderr
+        self.transfers = {}
+        self.rate = 0.0 # Total bytes per second
+        self.task = None
+        self.last_refresh = None
+        self.drawn_lines = 0
+        self.prompting = False # A line is being typed below the view; it's redrawn without moving off it
+
+    def add(self, name, total=None, done=0):
+        """Starts tracking a download (again, if it was tracked before) and returns its counters."""
+        transfer = self.transfers[name] = Transfer(name, total, done)
+        return transfer
+
+    def start(self):
+        if self.task is None:
+            self.last_refresh = time.monotonic() # Rates on the first refresh cover the time since now
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the renderer after drawing the final state."""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            self.refresh()
+
+    async def input(self, prompt):
+        """
+        Shows prompt on stdout and reads a line from stdin. When both the view and the prompt
+        are on a terminal, the view is drawn right above the prompt and keeps that many rows
+        until the line is entered, so it can be redrawn without touching what is being typed.
+        """
+        stream = self.stream or sys.stderr
+        self.prompting = not self.headless and sys.stdin.isatty() and stream.isatty()
+        if self.prompting:
+            self.drawn_lines = 0 # Whatever was printed since the last draw stays above the view
+            self.draw(self.lines())
+        try:
+            sys.stdout.write(prompt)
+            sys.stdout.flush()
+            return await asyncio.to_thread(sys.stdin.readline)
+        finally:
+            if self.prompting:
+                self.prompting = False
+                self.drawn_lines = 0 # The entered line is below the view now; start the next one after it
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.refresh()
+
+    def refresh(self):
+        self.update_rates()
+        if self.headless:
+            self.write(json.dumps(self.snapshot()) + "\n", self.stream or sys.stderr)
+        elif self.prompting:
+            self.draw_above_prompt(self.lines())
+        elif self.transfers:
+            self.draw(self.lines())
+
+    def update_rates(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refresh if self.last_refresh is not None else 0
+        self.last_refresh = now
+        self.rate = 0.0
+        for transfer in self.transfers.values():
+            done = transfer.done
+            if transfer.finished:
+                transfer.rate = 0.0
+            elif elapsed:
+                latest = max(0, done - transfer.last_done) / elapsed
+                transfer.rate = SMOOTHING * latest + (1 - SMOOTHING) * transfer.rate if transfer.rate else latest
+            transfer.last_done = done
+            self.rate += transfer.rate
+
+    def totals(self):
+        transfers = self.transfers.values()
+        active = [transfer for transfer in transfers if not transfer.finished]
+        remaining = sum(transfer.total - transfer.done for transfer in active if transfer.total is not None)
+        return {
+            "done": sum(transfer.done for transfer in transfers),
+            "total": sum(transfer.total for transfer in transfers if transfer.total is not None),
+            "rate": self.rate,
+            "eta_s": remaining / self.rate if self.rate else None,
+            "active": len(active),
+            "completed": sum(transfer.status == "completed" for transfer in transfers),
+            "failed": sum(transfer.status == "failed" for transfer in transfers),
+        }
+
+    def snapshot(self):
+        """Everything the view shows, as a JSON-ready dict."""
+        return {
+            "time": time.time(),
+            **self.totals(),
+            "files": [
+                {
+                    "name": transfer.name, "status": transfer.status, "done": transfer.done, "total": transfer.total,
+                    "rate": transfer.rate, "eta_s": transfer.eta(),
+                }
+                for transfer in self.transfers.values()
+            ],
+        }
+
+    def lines(self):
+        active = [transfer for transfer in self.transfers.values() if not transfer.finished]
+        lines = [format_row(transfer) for transfer in active[:MAX_ROWS]]
+        if len(active) > MAX_ROWS:
+            lines.append(f"  ... and {len(active) - MAX_ROWS} more")
+        totals = self.totals()
+        lines.append(
+            f"Total {format_bytes(totals['done'])}/{format_bytes(totals['total'])} at {format_bytes(totals['rate'])}/s, "
+            f"ETA {format_eta(totals['eta_s'])} | {totals['active']} active, {totals['completed']} completed, "
+            f"{totals['failed']} failed"
+        )
+        return lines
+
+    def draw(self, lines):
+        stream = self.stream or sys.stderr
+        if stream.isatty():
+            # Back to the top of the previous view and overwrite it in place
+            up = f"\x1b[{self.drawn_lines}F" if self.drawn_lines else ""
+            self.write(up + "".join(f"{fit(line)}\x1b[K\n" for line in lines) + "\x1b[J", stream)
+        else:
+            self.write("\n".join(lines) + "\n", stream)
+        self.drawn_lines = len(lines)
+
+    def draw_above_prompt(self, lines):
+        """Redraws the view in the drawn_lines rows above the prompt and puts the cursor back where it was."""
+        height = self.drawn_lines
+        if len(lines) > height:
+            lines = lines[:height - 1] + lines[-1:] # Keep the total line
+        lines = lines + [""] * (height - len(lines))
+        # Save the cursor, go up to the view, rewrite its rows and restore the cursor in the typed line
+        rows = "".join(f"{fit(line)}\x1b[K\n" for line in lines)
+        self.write(f"\x1b7\x1b[{height}F{rows}\x1b8", self.stream or sys.stderr)
+
+    def write(self, text, stream):
+        try:
+            stream.write(text)
+            stream.flush()
+        except (OSError, ValueError):
+            pass # Closed or gone; progress isn't worth failing a download over
+
+def fit(line):
+    """Cuts line to the terminal width, so every line of the view takes exactly one row."""
+    width = shutil.get_terminal_size().columns - 1
+    return line if len(line) <= width else line[:width]
+
+def format_row(transfer):
+    name = transfer.name if len(transfer.name) <= NAME_WIDTH else "..." + transfer.name[-(NAME_WIDTH - 3):]
+    percent = f"{transfer.done / transfer.total:6.1%}" if transfer.total else "     ?"
+    status = "" if transfer.status == "downloading" else f" [{transfer.status}]"
+    return (
+        f"{name:<{NAME_WIDTH}} {percent} {format_bytes(transfer.done):>9}/{format_bytes(transfer.total):<9} "
+        f"{format_bytes(transfer.rate):>9}/s ETA {format_eta(transfer.eta())}{status}"
+    )
+
+def format_bytes(count):
+    if count is None:
+        return "?"
+    for unit in ("B", "kB", "MB", "GB"):
+        if count < 1000:
+            return f"{count:.0f}{unit}" if unit == "B" else f"{count:.1f}{unit}"
+        count /= 1000
+    return f"{count:.1f}TB"
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,89 @@
+# bench_chat_client.py
+# Pipes --messages lines into the chat client in bulk mode and measures how fast they
+# reach another client, once per --max-batch value (1 sends a frame per message,
+# larger values let the client coalesce what is waiting into batched frames). The server
+# runs with its default send queues, and a run that loses messages fails the benchmark.
+#
+# Usage: python bench_chat_client.py --messages 50000 --max-batches 1 500
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import websockets
+
+from common import CHAT_SERVER, PROJECTS, ServerProcess, add_report_arguments, emit_report
+
+CHAT_CLIENT = os.path.join(PROJECTS, "RealTimeChatCLI", "client", "client.py")
+
+
+def count_messages(message_data):
+    if message_data.get("type") == "batch":
+        return sum(count_messages(inner) for inner in message_data.get("messages", []))
+    return message_data.get("type") == "chat_message"
+
+
+async def run_once(port, messages, max_batch, timeout):
+    """Time from starting the client until a listener has received every message."""
+    received = 0
+    async with websockets.connect(f"ws://127.0.0.1:{port}", max_queue=None) as listener:
+        await listener.recv() # your_id
+        lines = b"".join(b"bench message %d\n" % index for index in range(messages))
+        start = time.perf_counter()
+        client = await asyncio.create_subprocess_exec(
+            sys.executable, CHAT_CLIENT, "--uri", f"ws://127.0.0.1:{port}", "--bulk", "--quiet",
+            "--max-batch", str(max_batch),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL,
+        )
+        client.stdin.write(lines)
+        client.stdin.close()
+        try:
+            while received < messages:
+                received += count_messages(json.loads(await asyncio.wait_for(listener.recv(), timeout)))
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - start
+        await client.wait()
+    return received, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat client bulk send throughput by batch size")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--max-batches", type=int, nargs="+", default=[1, 500])
+    parser.add_argument("--idle-timeout", type=float, default=10.0, help="give up after this long without a message")
+    # The server's default of 200 requests per second per client would set the pace instead of
+    # the client; a load generator is meant for a server started without a limit, or a higher one
+    parser.add_argument("--rate-limit", type=float, default=0, help="the server's --rate-limit, 0 for none")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    runs = []
+    server_args = ("--host", "127.0.0.1", "--rate-limit", str(args.rate_limit))
+    with ServerProcess(*server_args, script=CHAT_SERVER) as server:
+        for max_batch in args.max_batches:
+            received, elapsed = asyncio.run(run_once(server.port, args.messages, max_batch, args.idle_timeout))
+            runs.append({
+                "max_batch": max_batch,
+                "received": received,
+                "lost": args.messages - received,
+                "wall_s": elapsed,
+                "messages_per_s": received / elapsed,
+            })
+
+    emit_report({
+        "scenario": "chat_client",
+        "messages": args.messages,
+        "throughput": runs[-1]["messages_per_s"],
+        "runs": runs,
+    }, args)
+    if any(run["lost"] for run in runs):
+        print("Messages were lost: " + ", ".join(
+            f"max_batch {run['max_batch']}: {run['lost']}" for run in runs if run["lost"]
+        ), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# bench_chat_encode.py
+# Compares server CPU per delivered message for the chat server's framing modes
+# (per-client websocket.send vs. frames prepared once, with and without shared
+# compression) at several client counts. Prints one JSON report with every run.
+#
+# Usage: python bench_chat_encode.py --client-counts 1000 10000 --messages 20
+import argparse
+
+from bench_chat_fanout import build_parser, run_scenario
+from common import emit_report
+
+MODES = {
+    "per_client": "--frame-mode per_client",
+    "prepared": "--frame-mode prepared",
+    "prepared_deflate": "--frame-mode prepared --compression shared",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Server CPU per delivered message by framing mode", parents=[build_parser()], add_help=False,
+    )
+    parser.add_argument("--client-counts", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    runs = []
+    for clients in args.client_counts:
+        for mode in args.modes:
+            args.clients = clients
+            args.senders = min(args.senders, clients // args.processes)
+            args.server_args = MODES[mode]
+            report = run_scenario(args)
+            runs.append({
+                "clients": clients,
+                "mode": mode,
+                "deliveries": report["deliveries"],
+                "expected_deliveries": report["expected_deliveries"],
+                "server_cpu_per_delivery_us": report["server_cpu_per_delivery_us"],
+                "latency_s": report["latency_s"],
+            })
+
+    emit_report({"scenario": "chat_encode", "runs": runs}, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# bench_chat_fanout.py
+# Load test for the WebSocket chat server: many simulated clients, a few senders,
+# and the delivery latency of every broadcast message at every client.
+#
+# Usage: python bench_chat_fanout.py --clients 10000 --senders 5 --messages 20 --processes 4
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from array import array
+
+import websockets
+
+from common import (
+    CHAT_SERVER, Measurement, ServerProcess, add_report_arguments, emit_report, percentiles, process_cpu_time, wait_until_idle,
+)
+
+BENCH_PREFIX = "bench:"
+CONNECT_CONCURRENCY = 200
+
+
+def collect_latencies(message_data, received_at, latencies):
+    """Records the latency of every benchmark message in a frame, unpacking batches."""
+    if message_data.get("type") == "batch":
+        for inner_message in message_data.get("messages", []):
+            collect_latencies(inner_message, received_at, latencies)
+    elif message_data.get("type") == "chat_message":
+        text = message_data.get("message", "")
+        if text.startswith(BENCH_PREFIX):
+            latencies.append(received_at - float(text[len(BENCH_PREFIX):]))
+
+
+async def receive(websocket, latencies, progress):
+    try:
+        async for frame in websocket:
+            before = len(latencies)
+            collect_latencies(json.loads(frame), time.time(), latencies)
+            if len(latencies) != before:
+                progress.set()
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+async def send(websocket, args):
+    interval = 1 / args.rate
+    try:
+        for _ in range(args.messages):
+            # Wall clock time, because senders and receivers live in different processes
+            await websocket.send(f"{BENCH_PREFIX}{time.time()!r}")
+            await asyncio.sleep(interval)
+    except websockets.exceptions.ConnectionClosed:
+        pass # Disconnected by the server, e.g. as a slow consumer
+
+
+async def run_clients(port, clients, senders, args, ready, start):
+    uri = f"ws://127.0.0.1:{port}"
+    connect_limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect():
+        async with connect_limit:
+            return await websockets.connect(uri, max_queue=None, open_timeout=60)
+
+    websockets_ = await asyncio.gather(*[connect() for _ in range(clients)])
+    latencies = array("d")
+    progress = asyncio.Event()
+    receivers = [asyncio.create_task(receive(websocket, latencies, progress)) for websocket in websockets_]
+
+    ready.put(clients)
+    await asyncio.to_thread(start.wait)
+    await asyncio.gather(*[send(websocket, args) for websocket in websockets_[:senders]])
+
+    # Wait until every message has arrived everywhere, or nothing arrives for a while
+    expected = args.senders * args.messages * clients
+    while len(latencies) < expected:
+        progress.clear()
+        try:
+            await asyncio.wait_for(progress.wait(), timeout=args.idle_timeout)
+        except asyncio.TimeoutError:
+            break
+
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*[websocket.close() for websocket in websockets_], return_exceptions=True)
+    return latencies
+
+
+def worker(port, first_index, clients, senders, args, ready, start, results):
+    latencies = array("d")
+    try:
+        latencies = asyncio.run(run_clients(port, clients, senders, args, ready, start))
+    finally:
+        results.put(latencies.tobytes()) # Always answer, so the coordinator never hangs
+
+
+def run(server, args, target=worker):
+    """
+    Runs target(port, first_index, clients, senders, args, ready, start, results) in
+    args.processes processes. Each one reports readiness, waits for the start signal
+    and returns its latencies as packed doubles.
+    """
+    ready, results = multiprocessing.Queue(), multiprocessing.Queue()
+    start = multiprocessing.Event()
+    shares = [args.clients // args.processes + (1 if i < args.clients % args.processes else 0) for i in range(args.processes)]
+    processes = [
+        multiprocessing.Process(
+            target=target,
+            args=(server.port, sum(shares[:i]), share, args.senders if i == 0 else 0, args, ready, start, results),
+        )
+        for i, share in enumerate(shares)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    wait_until_idle(server.process.pid) # Every connection registered by the server
+
+    # Server CPU is sampled around the messaging phase only, leaving out the handshakes
+    server_cpu_before = process_cpu_time(server.process.pid)
+    started = time.perf_counter()
+    start.set()
+    latencies = array("d")
+    for _ in processes:
+        latencies.frombytes(results.get())
+    elapsed = time.perf_counter() - started
+    server_cpu_after = process_cpu_time(server.process.pid)
+    for process in processes:
+        process.join()
+
+    server_cpu = None
+    if server_cpu_before is not None and server_cpu_after is not None:
+        server_cpu = server_cpu_after - server_cpu_before
+    return latencies, elapsed, server_cpu
+
+
+def run_scenario(args, target=worker, expected=None, scenario="chat_fanout"):
+    """Starts server.py with args.server_args, runs the load and returns the report."""
+    with ServerProcess("--host", "127.0.0.1", *args.server_args.split(), script=CHAT_SERVER) as server:
+        with Measurement() as measurement:
+            latencies, elapsed, server_cpu = run(server, args, target)
+
+    if expected is None:
+        expected = args.senders * args.messages * args.clients
+    return {
+        "scenario": scenario,
+        "config": vars(args),
+        "expected_deliveries": expected,
+        "deliveries": len(latencies),
+        "throughput": len(latencies) / elapsed, # Deliveries per second
+        "latency_s": percentiles(latencies),
+        "server_cpu_s": server_cpu,
+        "server_cpu_per_delivery_us": server_cpu / len(latencies) * 1_000_000 if server_cpu is not None and latencies else None,
+        "resources": measurement.as_dict(), # Coordinator only; the server is reported above
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="WebSocket chat server fan-out load test")
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--senders", type=int, default=5, help="clients that send messages")
+    parser.add_argument("--messages", type=int, default=20, help="messages per sender")
+    parser.add_argument("--rate", type=float, default=10.0, help="messages per second per sender")
+    parser.add_argument("--processes", type=int, default=4, help="client processes")
+    parser.add_argument("--idle-timeout", type=float, default=10.0)
+    parser.add_argument("--server-args", default="", help="extra arguments for server.py, e.g. '--overflow coalesce'")
+    add_report_arguments(parser)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    args.senders = min(args.senders, args.clients // args.processes)
+    emit_report(run_scenario(args), args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench_chat_logging.py
+# Server throughput with logging off, at its defaults (counters, stats lines and rate
+# limited connection events) and with a line for every message, for both chat servers.
+# Server output goes to a pipe read by a collector thread, like a log shipper would; with
+# --collector-rate the collector reads slowly, which is where blocking writes used to
+# stall the event loop.
+#
+# Usage: python bench_chat_logging.py --clients 2000 --senders 5 --messages 200 --rate 100
+import argparse
+import subprocess
+import threading
+import time
+
+from bench_chat_fanout import run, worker
+from bench_tcp_chat import tcp_worker
+from common import CHAT_SERVER, TCP_CHAT_SERVER, Measurement, ServerProcess, add_report_arguments, emit_report, percentiles
+
+SERVERS = {
+    "ws": (CHAT_SERVER, worker),
+    "tcp": (TCP_CHAT_SERVER, tcp_worker),
+}
+LOG_MODES = {
+    "off": ("--quiet",),
+    "default": ("--log-stats-interval", "1"),
+    "every_message": (
+        "--log-stats-interval", "1",
+        "--log-sample", "receive=1", "--log-rate", "receive=0", "--log-sample", "publish=1", "--log-rate", "publish=0",
+    ),
+}
+
+
+class Collector:
+    """Reads a server's output in a thread, at most rate bytes per second (0 for no limit)."""
+    def __init__(self, pipe, rate):
+        self.pipe = pipe
+        self.rate = rate
+        self.lines = 0
+        self.bytes = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        chunk = 4096 if self.rate else 1 << 16
+        while data := self.pipe.read1(chunk):
+            self.lines += data.count(b"\n")
+            self.bytes += len(data)
+            if self.rate:
+                time.sleep(len(data) / self.rate)
+
+
+def run_mode(kind, mode, args):
+    script, target = SERVERS[kind]
+    server_args = ("--host", "127.0.0.1", "--rate-limit", "0", *LOG_MODES[mode])
+    with ServerProcess(*server_args, script=script, stdout=subprocess.PIPE) as server:
+        collector = Collector(server.process.stdout, args.collector_rate)
+        with Measurement() as measurement:
+            latencies, elapsed, server_cpu = run(server, args, target=target)
+    collector.thread.join(timeout=5)
+    return {
+        "server": kind,
+        "logging": mode,
+        "deliveries": len(latencies),
+        "throughput": len(latencies) / elapsed, # Deliveries per second
+        "latency_s": percentiles(latencies),
+        "server_cpu_s": server_cpu,
+        "server_cpu_per_delivery_us": server_cpu / len(latencies) * 1_000_000 if server_cpu is not None and latencies else None,
+        "log_lines": collector.lines,
+        "log_bytes": collector.bytes,
+        "resources": measurement.as_dict(), # Coordinator only; the server is reported above
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat server throughput with logging on and off")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--senders", type=int, default=5, help="clients that send messages")
+    parser.add_argument("--messages", type=int, default=200, help="messages per sender")
+    parser.add_argument("--rate", type=float, default=100.0, help="messages per second per sender")
+    parser.add_argument("--processes", type=int, default=4, help="client processes")
+    parser.add_argument("--idle-timeout", type=float, default=10.0)
+    parser.add_argument("--collector-rate", type=int, default=0, help="bytes per second the log collector reads, 0 for no limit")
+    parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument("--modes", nargs="+", choices=list(LOG_MODES), default=list(LOG_MODES))
+    add_report_arguments(parser)
+    args = parser.parse_args()
+    args.senders = min(args.senders, args.clients // args.processes)
+    # What the TCP client workers expect from bench_tcp_chat's options
+    args.protocol, args.payload_size, args.slow_clients = "text", 0, 0
+
+    runs = [run_mode(kind, mode, args) for kind in args.servers for mode in args.modes]
+    emit_report({
+        "scenario": "chat_logging",
+        "config": vars(args),
+        "throughput": runs[-1]["throughput"],
+        "runs": runs,
+    }, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# bench_chat_rooms.py
+# Load test for chat rooms: clients leave the lobby and join a few of many rooms,
+# senders publish into their rooms, and every delivery's latency is recorded.
+# Server CPU per delivery should stay flat as --clients grows with a fixed room size.
+#
+# Usage: python bench_chat_rooms.py --clients 10000 --rooms 1000 --rooms-per-client 2
+import asyncio
+import json
+import time
+from array import array
+from collections import Counter
+
+import websockets
+
+from bench_chat_fanout import BENCH_PREFIX, CONNECT_CONCURRENCY, build_parser, collect_latencies, run_scenario
+from common import emit_report
+
+
+def rooms_for(index, args):
+    """Rooms joined by the client with the given global index, spread evenly over all rooms."""
+    return [f"room{(index * args.rooms_per_client + j) % args.rooms}" for j in range(args.rooms_per_client)]
+
+
+def sent_per_room(args):
+    """How many messages the senders publish to each room."""
+    counts = Counter()
+    for sender in range(args.senders):
+        rooms = rooms_for(sender, args)
+        for message in range(args.messages):
+            counts[rooms[message % len(rooms)]] += 1
+    return counts
+
+
+def expected_deliveries(first_index, clients, args):
+    counts = sent_per_room(args)
+    return sum(counts[room] for index in range(first_index, first_index + clients) for room in rooms_for(index, args))
+
+
+async def receive(websocket, acks, latencies, progress):
+    try:
+        async for frame in websocket:
+            message_data = json.loads(frame)
+            if message_data.get("type") in ("joined", "left"):
+                acks.append(1)
+                progress.set()
+                continue
+            before = len(latencies)
+            collect_latencies(message_data, time.time(), latencies)
+            if len(latencies) != before:
+                progress.set()
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+async def send(websocket, index, args):
+    rooms = rooms_for(index, args)
+    interval = 1 / args.rate
+    try:
+        for message in range(args.messages):
+            await websocket.send(json.dumps({
+                "type": "publish", "room": rooms[message % len(rooms)], "message": f"{BENCH_PREFIX}{time.time()!r}",
+            }))
+            await asyncio.sleep(interval)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+async def wait_for_count(values, target, progress, timeout):
+    while len(values) < target:
+        progress.clear()
+        try:
+            await asyncio.wait_for(progress.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return
+
+
+async def run_room_clients(port, first_index, clients, senders, args, ready, start):
+    uri = f"ws://127.0.0.1:{port}"
+    connect_limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(index):
+        async with connect_limit:
+            websocket = await websockets.connect(uri, max_queue=None, open_timeout=60)
+            for room in rooms_for(index, args):
+                await websocket.send(json.dumps({"type": "join", "room": room}))
+            await websocket.send(json.dumps({"type": "leave", "room": "lobby"}))
+            return websocket
+
+    acks, latencies = [], array("d")
+    progress = asyncio.Event()
+    indexes = range(first_index, first_index + clients)
+    websockets_ = await asyncio.gather(*[connect(index) for index in indexes])
+    receivers = [asyncio.create_task(receive(websocket, acks, latencies, progress)) for websocket in websockets_]
+    await wait_for_count(acks, clients * (args.rooms_per_client + 1), progress, args.idle_timeout)
+
+    ready.put(clients)
+    await asyncio.to_thread(start.wait)
+    await asyncio.gather(*[send(websocket, index, args) for websocket, index in zip(websockets_[:senders], indexes)])
+    await wait_for_count(latencies, expected_deliveries(first_index, clients, args), progress, args.idle_timeout)
+
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*[websocket.close() for websocket in websockets_], return_exceptions=True)
+    return latencies
+
+
+def rooms_worker(port, first_index, clients, senders, args, ready, start, results):
+    latencies = array("d")
+    try:
+        latencies = asyncio.run(run_room_clients(port, first_index, clients, senders, args, ready, start))
+    finally:
+        results.put(latencies.tobytes())
+
+
+def main():
+    parser = build_parser()
+    parser.description = "WebSocket chat server rooms load test"
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--rooms-per-client", type=int, default=2)
+    args = parser.parse_args()
+    args.senders = min(args.senders, args.clients // args.processes)
+
+    report = run_scenario(
+        args, target=rooms_worker, expected=expected_deliveries(0, args.clients, args), scenario="chat_rooms",
+    )
+    report["average_room_size"] = args.clients * args.rooms_per_client / args.rooms
+    emit_report(report, args)
+
+if __name__ == "__main__":
+    main()
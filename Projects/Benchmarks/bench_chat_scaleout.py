@@ -0,0 +1,42 @@
+# bench_chat_scaleout.py
+# Messages/sec and delivery latency of the chat server against its process count
+# (server.py --workers N, sharing the port through SO_REUSEPORT and a pub/sub bus).
+#
+# Usage: python bench_chat_scaleout.py --worker-counts 1 2 4 --clients 4000 --bus unix
+import argparse
+
+from bench_chat_fanout import build_parser, run_scenario
+from common import emit_report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Chat server throughput and latency by process count", parents=[build_parser()], add_help=False,
+    )
+    parser.add_argument("--worker-counts", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--bus", choices=("unix", "redis"), default="unix")
+    parser.add_argument("--redis-url", default=None, help="for --bus redis, e.g. a running redis_standin.py")
+    args = parser.parse_args()
+    args.senders = min(args.senders, args.clients // args.processes)
+    extra = args.server_args
+
+    runs = []
+    for workers in args.worker_counts:
+        args.server_args = f"{extra} --workers {workers} --bus {args.bus}"
+        if args.redis_url:
+            args.server_args += f" --redis-url {args.redis_url}"
+        report = run_scenario(args)
+        runs.append({
+            "workers": workers,
+            "deliveries": report["deliveries"],
+            "expected_deliveries": report["expected_deliveries"],
+            "throughput": report["throughput"], # Deliveries per second
+            "messages_per_s": report["throughput"] / args.clients, # Published messages fully delivered per second
+            "latency_s": report["latency_s"],
+            "server_cpu_per_delivery_us": report["server_cpu_per_delivery_us"],
+        })
+
+    emit_report({"scenario": "chat_scaleout", "bus": args.bus, "runs": runs}, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# bench_downloader.py
+# Downloads files from the synthetic server through Async_Downloader's DownloadManager
+# and reports a JSON summary. With --stop-after the manager is stopped part way (in-flight
+# downloads get --drain-deadline seconds, then are checkpointed) and a new one resumes
+# from the checkpoint.
+#
+# Usage: python bench_downloader.py --files 8 --size 20000000 --bandwidth 50000000 [--output run.json]
+#        python bench_downloader.py --files 8 --bandwidth 20000000 --stop-after 0.5 --drain-deadline 0
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+from common import Measurement, ServerProcess, add_project_path, add_report_arguments, emit_report, percentiles
+
+add_project_path("Async_Downloader")
+from AI import DownloadManager # noqa: E402
+
+POLL_INTERVAL = 0.005
+
+
+async def interrupt_downloads(port, args, directory, checkpoint):
+    """Starts every download, stops the manager args.stop_after seconds in and reports how the shutdown went."""
+    manager = DownloadManager(checkpoint_path=checkpoint)
+    manager.active_downloads_limit = args.workers
+    manager_task = asyncio.create_task(manager.start())
+    for index in range(args.files):
+        filename = os.path.join(directory, f"bench{index}.bin")
+        await manager.add_download(filename, f"http://127.0.0.1:{port}/files/{args.size}")
+    await asyncio.sleep(args.stop_after)
+
+    stop_start = time.perf_counter()
+    manager.stop(args.drain_deadline)
+    await manager_task
+    statuses = [info["status"] for info in manager.downloads.values()]
+    return {
+        "shutdown_s": time.perf_counter() - stop_start,
+        "completed": statuses.count("completed"),
+        "checkpointed": statuses.count("checkpointed"),
+        "checkpointed_bytes": sum(info["offset"] for info in manager.downloads.values() if info["status"] == "checkpointed"),
+        "pending": statuses.count("pending"),
+    }
+
+
+async def run_downloads(port, args, directory):
+    start = time.perf_counter()
+    checkpoint = os.path.join(directory, "checkpoint.json")
+    interrupted = None
+    if args.stop_after:
+        # Stop part way, then let a new manager resume from the checkpoint
+        interrupted = await interrupt_downloads(port, args, directory, checkpoint)
+        manager = DownloadManager(checkpoint_path=checkpoint)
+        await manager.load_checkpoint()
+    else:
+        manager = DownloadManager()
+        for index in range(args.files):
+            filename = os.path.join(directory, f"bench{index}.bin")
+            await manager.add_download(filename, f"http://127.0.0.1:{port}/files/{args.size}")
+    manager.active_downloads_limit = args.workers
+    manager_task = asyncio.create_task(manager.start())
+
+    # DownloadManager has no completion callback, so watch the status table
+    finished_at = {}
+    while len(finished_at) < len(manager.downloads):
+        for filename, info in manager.downloads.items():
+            if filename not in finished_at and info["status"] in ("completed", "failed"):
+                finished_at[filename] = time.perf_counter() - start
+        await asyncio.sleep(POLL_INTERVAL)
+    transfer_time = time.perf_counter() - start
+
+    stop_start = time.perf_counter()
+    manager.stop()
+    await manager_task
+    shutdown_time = time.perf_counter() - stop_start
+
+    statuses = [info["status"] for info in manager.downloads.values()]
+    if interrupted:
+        statuses += ["completed"] * interrupted["completed"]
+    paths = [os.path.join(directory, f"bench{index}.bin") for index in range(args.files)]
+    received = sum(os.path.getsize(path) for path in paths if os.path.exists(path)) # Failed downloads leave no file
+    return list(finished_at.values()), statuses, received, transfer_time, shutdown_time, interrupted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DownloadManager benchmark against the synthetic server")
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--size", type=int, default=20 * 1024 * 1024, help="bytes per file")
+    parser.add_argument("--workers", type=int, default=3, help="concurrent downloads")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes/s per download, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--stop-after", type=float, default=0.0,
+                        help="stop the manager this many seconds in, then resume from its checkpoint")
+    parser.add_argument("--drain-deadline", type=float, default=0.0,
+                        help="with --stop-after: seconds in-flight downloads get to finish before being checkpointed")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    server_args = [
+        "--hosts", "1", "--latency", str(args.latency), "--jitter", "0", "--bandwidth", str(args.bandwidth),
+        "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+    ]
+
+    with ServerProcess(*server_args) as server, tempfile.TemporaryDirectory() as directory:
+        # The manager reports progress with print() and its progress view; keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr), Measurement() as measurement:
+            durations, statuses, received, transfer_time, shutdown_time, interrupted = asyncio.run(
+                run_downloads(server.port, args, directory)
+            )
+
+    report = {
+        "scenario": "downloader",
+        "config": vars(args),
+        "completed": statuses.count("completed"),
+        "failed": statuses.count("failed"),
+        "received_bytes": received,
+        "throughput": received / transfer_time, # Bytes per second
+        "latency_s": percentiles(durations), # Time from enqueue to completion per file
+        "shutdown_s": shutdown_time,
+        "interrupted": interrupted, # With --stop-after: the first manager's shutdown and checkpoint
+        "resources": measurement.as_dict(),
+    }
+    emit_report(report, args)
+
+if __name__ == "__main__":
+    main()
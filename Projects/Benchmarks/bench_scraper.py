@@ -0,0 +1,113 @@
+# bench_scraper.py
+# Crawls the synthetic server with the AWebScraper fetch path and reports a JSON summary.
+#
+# Usage: python bench_scraper.py --hosts 50 --pages 20 --latency 0.02 [--output run.json] [--baseline old.json]
+import argparse
+import asyncio
+import contextlib
+import sys
+import time
+
+import aiohttp
+from yarl import URL
+
+from common import Measurement, ServerProcess, add_project_path, add_report_arguments, emit_report, percentiles
+from synthetic_server import bench_resolver, host_url
+
+add_project_path("AWebScraper")
+import scraper # noqa: E402
+from robots_cache import robots_cache # noqa: E402
+from utils import fetch_with_retries # noqa: E402
+
+USER_AGENT = "AWebScraperBench"
+
+
+async def crawl(port, args):
+    urls = [
+        host_url(port, host, f"/private/{page}" if page % 10 == 9 else f"/page/{page}")
+        for page in range(args.pages)
+        for host in range(args.hosts)
+    ]
+    latencies = []
+    # fetch() returns the body of error responses too; their status decides the outcome
+    outcomes = {"ok": 0, "http_error": 0, "failed": 0, "disallowed": 0}
+    statuses = {} # Count of every response status, retries and robots.txt included
+    last_status = {} # URL -> status of its last response
+    received = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(session, url):
+        nonlocal received
+        async with semaphore:
+            start = time.perf_counter()
+            if args.robots and not await robots_cache.is_allowed(session, url, USER_AGENT):
+                outcomes["disallowed"] += 1
+                return
+            content = await fetch_with_retries(session, url, 3, stream=args.stream, max_chars=args.max_chars)
+            latencies.append(time.perf_counter() - start)
+            if content is None:
+                outcomes["failed"] += 1
+            elif last_status.get(URL(url), 200) >= 400:
+                outcomes["http_error"] += 1
+            else:
+                outcomes["ok"] += 1
+                received += len(content)
+
+    async def on_request_end(session, ctx, params):
+        status = params.response.status
+        statuses[status] = statuses.get(status, 0) + 1
+        last_status[params.url] = status
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_end.append(on_request_end)
+    connector = aiohttp.TCPConnector(resolver=bench_resolver(), limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector, trace_configs=[trace_config]) as session:
+        await asyncio.gather(*[one(session, url) for url in urls])
+
+    return len(urls), latencies, outcomes, {str(status): count for status, count in sorted(statuses.items())}, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AWebScraper benchmark against the synthetic server")
+    parser.add_argument("--hosts", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=20, help="pages fetched per host")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.0, help="per-domain rate limiter delay in seconds")
+    parser.add_argument("--robots", action="store_true", help="check robots.txt before every fetch")
+    parser.add_argument("--stream", action="store_true", help="use the streaming fetch mode")
+    parser.add_argument("--max-chars", type=int, default=None, help="stop reading after this many characters (with --stream)")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--bandwidth", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=16 * 1024)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    scraper.rate_limiter.delay = args.delay
+    server_args = [
+        "--hosts", str(args.hosts), "--latency", str(args.latency), "--bandwidth", str(args.bandwidth),
+        "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+        "--page-size", str(args.page_size),
+    ]
+
+    with ServerProcess(*server_args) as server:
+        # The scraper reports progress with print(); keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr), Measurement() as measurement:
+            requests, latencies, outcomes, statuses, received = asyncio.run(crawl(server.port, args))
+
+    report = {
+        "scenario": "scraper",
+        "config": vars(args),
+        "requests": requests,
+        "outcomes": outcomes,
+        "statuses": statuses,
+        "throughput": requests / measurement.wall, # Requests per second
+        "received_chars": received,
+        "latency_s": percentiles(latencies),
+        "resources": measurement.as_dict(),
+    }
+    emit_report(report, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# bench_tcp_chat.py
+# Load test for the asyncio TCP chat server (RealTimeChatCLI/other/server.py): thousands
+# of raw TCP clients, a few senders, and the delivery latency of every message at every
+# client. --slow-clients connect but never read, to show they don't hold up the others
+# and are disconnected once their buffers fill up. Each of --protocols (newline-delimited
+# text, length-prefixed binary frames) gets its own run against a fresh server.
+#
+# Usage: python bench_tcp_chat.py --clients 5000 --senders 5 --messages 20 --slow-clients 10 --payload-size 4096
+import argparse
+import asyncio
+import itertools
+import time
+from array import array
+
+from bench_chat_fanout import BENCH_PREFIX, CONNECT_CONCURRENCY, run
+from common import Measurement, ServerProcess, TCP_CHAT_SERVER, add_project_path, add_report_arguments, emit_report, percentiles
+
+add_project_path("RealTimeChatCLI/other")
+from protocol import HELLO_LINE, MESSAGE, encode_frame, read_frames
+
+PREFIX = BENCH_PREFIX.encode()
+PROTOCOLS = ("text", "binary")
+
+
+def record_latency(message, latencies, progress):
+    # "bench:<send time> <padding>", after the sender's address in the text protocol
+    _, _, sent_at = message.partition(PREFIX)
+    if sent_at:
+        latencies.append(time.time() - float(sent_at.split(None, 1)[0]))
+        progress.set()
+
+
+async def receive(reader, latencies, progress, protocol):
+    try:
+        if protocol == "binary":
+            async for frame_type, _, _, payload in read_frames(reader):
+                if frame_type == MESSAGE:
+                    record_latency(payload, latencies, progress)
+        else:
+            while line := await reader.readline():
+                record_latency(line, latencies, progress)
+    except ConnectionError:
+        pass
+
+
+async def send(writer, args):
+    interval = 1 / args.rate
+    padding = b"x" * args.payload_size
+    seqs = itertools.count(1)
+    try:
+        for _ in range(args.messages):
+            # Wall clock time, because senders and receivers live in different processes
+            message = b"%s%r %s" % (PREFIX, time.time(), padding)
+            if args.protocol == "binary":
+                writer.write(encode_frame(MESSAGE, 0, next(seqs), message))
+            else:
+                writer.write(message + b"\n")
+            await writer.drain()
+            await asyncio.sleep(interval)
+    except ConnectionError:
+        pass
+
+
+async def is_disconnected(reader):
+    """Reads whatever a slow client has buffered and tells whether the server closed the connection."""
+    try:
+        while await asyncio.wait_for(reader.read(1 << 20), timeout=1.0):
+            pass
+        return True
+    except asyncio.TimeoutError:
+        return False
+    except ConnectionError:
+        return True
+
+
+async def run_clients(port, first_index, clients, senders, args, ready, start):
+    connect_limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    slow = args.slow_clients if first_index == 0 else 0
+
+    async def connect():
+        async with connect_limit:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            if args.protocol == "binary":
+                writer.write(HELLO_LINE)
+            return reader, writer
+
+    connections = await asyncio.gather(*[connect() for _ in range(clients)])
+    slow_connections = await asyncio.gather(*[connect() for _ in range(slow)])
+    latencies = array("d")
+    progress = asyncio.Event()
+    receivers = [asyncio.create_task(receive(reader, latencies, progress, args.protocol)) for reader, _ in connections]
+
+    ready.put(clients)
+    await asyncio.to_thread(start.wait)
+    await asyncio.gather(*[send(writer, args) for _, writer in connections[:senders]])
+
+    # Senders don't get their own messages back
+    expected = args.senders * args.messages * clients - senders * args.messages
+    while len(latencies) < expected:
+        progress.clear()
+        try:
+            await asyncio.wait_for(progress.wait(), timeout=args.idle_timeout)
+        except asyncio.TimeoutError:
+            break
+
+    evicted = sum(await asyncio.gather(*[is_disconnected(reader) for reader, _ in slow_connections]))
+    if slow:
+        print(f"{evicted} of {slow} slow clients were disconnected by the server")
+    for task in receivers:
+        task.cancel()
+    for _, writer in connections + slow_connections:
+        writer.close()
+    return latencies
+
+
+def tcp_worker(port, first_index, clients, senders, args, ready, start, results):
+    latencies = array("d")
+    try:
+        latencies = asyncio.run(run_clients(port, first_index, clients, senders, args, ready, start))
+    finally:
+        results.put(latencies.tobytes()) # Always answer, so the coordinator never hangs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio TCP chat server fan-out load test")
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--senders", type=int, default=5, help="clients that send messages")
+    parser.add_argument("--messages", type=int, default=20, help="messages per sender")
+    parser.add_argument("--rate", type=float, default=10.0, help="messages per second per sender")
+    parser.add_argument("--payload-size", type=int, default=0, help="padding bytes added to every message")
+    parser.add_argument("--slow-clients", type=int, default=0, help="extra clients that never read")
+    parser.add_argument("--processes", type=int, default=4, help="client processes")
+    parser.add_argument("--idle-timeout", type=float, default=10.0)
+    parser.add_argument("--server-args", default="", help="extra arguments for other/server.py")
+    parser.add_argument("--protocols", nargs="+", choices=PROTOCOLS, default=list(PROTOCOLS))
+    add_report_arguments(parser)
+    args = parser.parse_args()
+    args.senders = min(args.senders, args.clients // args.processes)
+
+    runs = []
+    for protocol in args.protocols:
+        args.protocol = protocol
+        server_args = ("--host", "127.0.0.1", "--rate-limit", "0", *args.server_args.split()) # Senders may flood
+        with ServerProcess(*server_args, script=TCP_CHAT_SERVER) as server:
+            with Measurement() as measurement:
+                latencies, elapsed, server_cpu = run(server, args, target=tcp_worker)
+        runs.append({
+            "protocol": protocol,
+            "deliveries": len(latencies),
+            "throughput": len(latencies) / elapsed, # Deliveries per second
+            "latency_s": percentiles(latencies),
+            "server_cpu_s": server_cpu,
+            "server_cpu_per_delivery_us": server_cpu / len(latencies) * 1_000_000 if server_cpu is not None and latencies else None,
+            "resources": measurement.as_dict(), # Coordinator only; the server is reported above
+        })
+
+    emit_report({
+        "scenario": "tcp_chat",
+        "config": vars(args),
+        "expected_deliveries": args.senders * args.messages * (args.clients - 1),
+        "throughput": runs[-1]["throughput"],
+        "runs": runs,
+    }, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# common.py
+# Helpers shared by the benchmark scenarios: server process, measurements and reports.
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROJECTS = os.path.dirname(HERE)
+
+
+def add_project_path(name):
+    """Makes the modules of Projects/<name> importable the way they import each other."""
+    path = os.path.join(PROJECTS, name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+SYNTHETIC_SERVER = os.path.join(HERE, "synthetic_server.py")
+CHAT_SERVER = os.path.join(PROJECTS, "RealTimeChatCLI", "server", "server.py")
+TCP_CHAT_SERVER = os.path.join(PROJECTS, "RealTimeChatCLI", "other", "server.py")
+
+
+class ServerProcess:
+    """Runs a server script in a child process so its CPU is not counted against the client."""
+    def __init__(self, *server_args, port=None, script=SYNTHETIC_SERVER, stdout=subprocess.DEVNULL):
+        self.port = port or free_port()
+        self.args = [sys.executable, script, "--port", str(self.port), *server_args]
+        self.stdout = stdout
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.args, stdout=self.stdout)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.2).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        self.process.kill()
+        raise RuntimeError(f"{os.path.basename(self.args[1])} did not start on port {self.port}")
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.process.terminate()
+        self.process.wait()
+        return False
+
+
+def _child_pids(pid):
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as fs:
+                children.extend(int(child) for child in fs.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def process_cpu_time(pid, include_children=True):
+    """
+    CPU seconds (user + system) used so far by another process and, by default, its
+    running descendants (e.g. the chat server's worker processes). None if unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as fs:
+            fields = fs.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None # Not Linux, or the process is gone
+    utime, stime = int(fields[11]), int(fields[12])
+    total = (utime + stime) / os.sysconf("SC_CLK_TCK")
+    if include_children:
+        for child in _child_pids(pid):
+            total += process_cpu_time(child) or 0.0
+    return total
+
+
+def process_rss(pid):
+    """Resident memory of another process in bytes, or None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as fs:
+            for line in fs:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def wait_until_idle(pid, interval=0.2, threshold=0.01, timeout=30.0):
+    """
+    Waits until a server process stops using CPU, e.g. after it has worked through a
+    backlog of accepted connections. Connecting clients only know the kernel accepted
+    them, not that the server has registered them yet.
+    """
+    deadline = time.monotonic() + timeout
+    before = process_cpu_time(pid)
+    while before is not None and time.monotonic() < deadline:
+        time.sleep(interval)
+        after = process_cpu_time(pid)
+        if after is None or after - before < threshold:
+            return
+        before = after
+
+
+class Measurement:
+    """Wall time, CPU time and peak RSS of the current process over a with-block."""
+    def __enter__(self):
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.wall = time.perf_counter() - self.start_wall
+        self.cpu = time.process_time() - self.start_cpu
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.peak_rss = max_rss if sys.platform == "darwin" else max_rss * 1024
+        return False
+
+    def as_dict(self):
+        return {"wall_s": self.wall, "cpu_s": self.cpu, "peak_rss_bytes": self.peak_rss}
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    if not samples:
+        return {f"p{point}": None for point in points}
+    ordered = sorted(samples)
+    return {
+        f"p{point}": ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))]
+        for point in points
+    }
+
+
+# Metrics compared against a baseline, and whether a higher value is better
+REGRESSION_CHECKS = {
+    "throughput": True,
+    "latency_s.p50": False,
+    "latency_s.p99": False,
+    "resources.cpu_s": False,
+    "resources.peak_rss_bytes": False,
+}
+
+
+def _lookup(report, dotted):
+    value = report
+    for key in dotted.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def find_regressions(report, baseline, tolerance):
+    regressions = []
+    for metric, higher_is_better in REGRESSION_CHECKS.items():
+        new, old = _lookup(report, metric), _lookup(baseline, metric)
+        if not new or not old:
+            continue
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{metric}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+    return regressions
+
+
+def add_report_arguments(parser):
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression (default 0.10)")
+
+
+def emit_report(report, args):
+    """Prints or saves the report; exits with status 1 if it regresses against --baseline."""
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fs:
+            fs.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as fs:
+            baseline = json.load(fs)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
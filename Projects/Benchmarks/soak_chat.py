@@ -0,0 +1,150 @@
+# soak_chat.py
+# Connection churn soak test for both chat servers. Every round, --clients clients
+# connect, send a message and leave (half closing cleanly, half aborting the TCP
+# connection), while --silent clients connect and then never answer a heartbeat, like
+# peers behind a dead network path. The servers run with short heartbeat settings, so
+# each round also waits for the silent ones to be dropped. Server memory is sampled
+# after every round; it should level off after the first few rounds instead of growing.
+#
+# Usage: python soak_chat.py --rounds 20 --clients 500 --silent 50 --servers ws tcp
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+
+import websockets
+
+from bench_chat_fanout import CONNECT_CONCURRENCY
+from common import (
+    CHAT_SERVER, TCP_CHAT_SERVER, ServerProcess, add_report_arguments, emit_report, process_rss, wait_until_idle,
+)
+
+HEARTBEAT_ARGS = ("--heartbeat-interval", "1", "--idle-timeout", "3")
+SERVERS = {
+    "ws": (CHAT_SERVER, ("--host", "127.0.0.1", *HEARTBEAT_ARGS)),
+    "tcp": (TCP_CHAT_SERVER, ("--host", "127.0.0.1", *HEARTBEAT_ARGS)),
+}
+DROP_WAIT = 6.0 # Idle timeout plus a couple of wheel ticks
+
+
+async def churn_ws(port, index):
+    websocket = await websockets.connect(f"ws://127.0.0.1:{port}", open_timeout=60)
+    await websocket.send(json.dumps({"type": "publish", "room": "lobby", "message": f"soak {index}"}))
+    if index % 2:
+        websocket.transport.abort()
+    else:
+        await websocket.close()
+
+
+async def churn_tcp(port, index):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"soak %d\n" % index)
+    await writer.drain()
+    if index % 2:
+        writer.transport.abort()
+    else:
+        writer.close()
+
+
+async def open_silent(kind, port):
+    """A connection that completes its handshake and then never says anything again."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    if kind == "ws":
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((
+            f"GET / HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+        await reader.readuntil(b"\r\n\r\n")
+    return reader, writer
+
+
+async def was_dropped(reader):
+    """Reads what the server sent (heartbeats) and tells whether it closed the connection."""
+    try:
+        while await asyncio.wait_for(reader.read(65536), timeout=1.0):
+            pass
+        return True
+    except asyncio.TimeoutError:
+        return False
+    except ConnectionError:
+        return True
+
+
+async def soak_round(kind, port, round_index, args):
+    limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    churn = churn_ws if kind == "ws" else churn_tcp
+
+    async def limited(coroutine):
+        async with limit:
+            return await coroutine
+
+    silent = await asyncio.gather(*[limited(open_silent(kind, port)) for _ in range(args.silent)])
+    results = await asyncio.gather(
+        *[limited(churn(port, round_index * args.clients + i)) for i in range(args.clients)], return_exceptions=True,
+    )
+    errors = sum(isinstance(result, Exception) for result in results)
+    await asyncio.sleep(DROP_WAIT)
+    dropped = sum(await asyncio.gather(*[was_dropped(reader) for reader, _ in silent]))
+    for _, writer in silent:
+        writer.close()
+    return errors, dropped
+
+
+def soak(kind, args):
+    script, server_args = SERVERS[kind]
+    rounds = []
+    with ServerProcess(*server_args, script=script) as server:
+        pid = server.process.pid
+        for round_index in range(args.rounds):
+            started = time.perf_counter()
+            errors, dropped = asyncio.run(soak_round(kind, server.port, round_index, args))
+            wait_until_idle(pid)
+            rounds.append({
+                "round": round_index,
+                "wall_s": time.perf_counter() - started,
+                "connect_errors": errors,
+                "silent_dropped": dropped,
+                "server_rss_bytes": process_rss(pid),
+            })
+            print(f"{kind} round {round_index}: rss {rounds[-1]['server_rss_bytes']} dropped {dropped}/{args.silent}",
+                  flush=True)
+
+    # Growth from the end of the warm-up rounds to the end of the run. The allocator
+    # keeps its high-water mark for a while, so the first rounds always step upwards.
+    samples = [entry["server_rss_bytes"] for entry in rounds if entry["server_rss_bytes"]]
+    warmup_rounds = args.rounds // 2 if args.warmup_rounds is None else args.warmup_rounds
+    warmed_up = samples[min(warmup_rounds, len(samples) - 1)] if samples else None
+    return {
+        "server": kind,
+        "rss_after_warmup_bytes": warmed_up,
+        "rss_final_bytes": samples[-1] if samples else None,
+        "rss_growth": (samples[-1] - warmed_up) / warmed_up if warmed_up else None,
+        "silent_dropped": sum(entry["silent_dropped"] for entry in rounds),
+        "silent_total": args.silent * args.rounds,
+        "rounds": rounds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection churn soak test for the chat servers")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=500, help="short-lived clients per round")
+    parser.add_argument("--silent", type=int, default=50, help="clients per round that stop answering")
+    parser.add_argument("--warmup-rounds", type=int, help="rounds before memory is expected to level off (default: half)")
+    parser.add_argument("--max-growth", type=float, default=0.10,
+                        help="fail if server memory grows more than this after the warm-up rounds")
+    parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    results = [soak(kind, args) for kind in args.servers]
+    emit_report({"scenario": "chat_soak", "config": vars(args), "servers": results}, args)
+    leaking = [result["server"] for result in results if result["rss_growth"] and result["rss_growth"] > args.max_growth]
+    if leaking:
+        raise SystemExit(f"Server memory kept growing: {', '.join(leaking)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# synthetic_server.py
+# A local aiohttp server that pretends to be many websites at once.
+# Requests for http://host<N>.bench.test:<port>/... are routed by their Host header
+# to virtual host N; use bench_resolver() so aiohttp resolves *.bench.test to 127.0.0.1.
+#
+# Usage: python synthetic_server.py --port 8900 --hosts 50 --latency 0.05 --bandwidth 1000000
+import argparse
+import asyncio
+import random
+import re
+import socket
+
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+
+BENCH_DOMAIN = "bench.test"
+HOST_RE = re.compile(r"^host(\d+)\." + re.escape(BENCH_DOMAIN) + r"(:\d+)?$")
+WRITE_CHUNK = 16 * 1024
+
+
+class VirtualHost:
+    """Behaviour of one simulated website."""
+    def __init__(self, index, latency, jitter, bandwidth, error_rate, throttle_rate, robots_txt, page_size):
+        self.index = index
+        self.latency = latency # Seconds before the response headers are sent
+        self.jitter = jitter # Extra uniformly random latency, in seconds
+        self.bandwidth = bandwidth # Bytes per second for bodies, 0 means unlimited
+        self.error_rate = error_rate # Fraction of requests answered with 500
+        self.throttle_rate = throttle_rate # Fraction of requests answered with 429
+        self.robots_txt = robots_txt
+        self.page_size = page_size
+        self.random = random.Random(index) # Seeded so runs are reproducible
+
+
+def build_hosts(args):
+    hosts = []
+    for index in range(args.hosts):
+        # Every fourth host disallows /private/ so robots.txt handling gets exercised
+        robots_txt = "User-agent: *\nDisallow: /private/\n" if index % 4 == 0 else "User-agent: *\nAllow: /\n"
+        hosts.append(VirtualHost(
+            index=index,
+            latency=args.latency,
+            jitter=args.jitter,
+            bandwidth=args.bandwidth,
+            error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate,
+            robots_txt=robots_txt,
+            page_size=args.page_size,
+        ))
+    return hosts
+
+
+def get_host(request) -> VirtualHost:
+    hosts = request.app["hosts"]
+    match = HOST_RE.match(request.host or "")
+    index = int(match.group(1)) if match else 0 # Plain 127.0.0.1 requests go to host 0
+    return hosts[index % len(hosts)]
+
+
+async def simulate_latency(host: VirtualHost):
+    delay = host.latency + (host.random.uniform(0, host.jitter) if host.jitter else 0)
+    if delay:
+        await asyncio.sleep(delay)
+
+
+def injected_failure(host: VirtualHost):
+    """Returns an error response for this request, or None if it should succeed."""
+    roll = host.random.random()
+    if roll < host.throttle_rate:
+        return web.Response(status=429, headers={"Retry-After": "1"}, text="Too Many Requests")
+    if roll < host.throttle_rate + host.error_rate:
+        return web.Response(status=500, text="Internal Server Error")
+    return None
+
+
+async def write_throttled(response, body: memoryview, bandwidth: int):
+    """Writes body in chunks, sleeping between them to respect bandwidth (bytes/s)."""
+    for offset in range(0, len(body), WRITE_CHUNK):
+        chunk = body[offset:offset + WRITE_CHUNK]
+        await response.write(chunk)
+        if bandwidth:
+            await asyncio.sleep(len(chunk) / bandwidth)
+
+
+def parse_range(range_header: str, size: int):
+    """Parses a single 'bytes=start-end' range. Returns (start, end) inclusive, or None."""
+    match = re.match(r"^bytes=(\d*)-(\d*)$", range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else: # Suffix range: last N bytes
+        start = max(0, size - int(match.group(2)))
+        end = size - 1
+    if start >= size or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+async def robots(request):
+    host = get_host(request)
+    await simulate_latency(host)
+    return web.Response(text=host.robots_txt)
+
+
+async def page(request):
+    host = get_host(request)
+    await simulate_latency(host)
+    failure = injected_failure(host)
+    if failure is not None:
+        return failure
+
+    name = request.match_info["name"]
+    header = f"<html><head><title>host{host.index} {name}</title></head><body>"
+    footer = "</body></html>"
+    filler = "x" * max(0, host.page_size - len(header) - len(footer))
+    body = (header + filler + footer).encode()
+
+    response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+    response.content_length = len(body)
+    await response.prepare(request)
+    await write_throttled(response, memoryview(body), host.bandwidth)
+    await response.write_eof()
+    return response
+
+
+async def file(request):
+    """Serves size bytes of zeros, with Range support, e.g. /files/104857600."""
+    host = get_host(request)
+    await simulate_latency(host)
+    failure = injected_failure(host)
+    if failure is not None:
+        return failure
+
+    size = int(request.match_info["size"])
+    start, end = 0, size - 1
+    status = 200
+    headers = {"Content-Type": "application/octet-stream", "Accept-Ranges": "bytes"}
+
+    if "Range" in request.headers:
+        byte_range = parse_range(request.headers["Range"], size)
+        if byte_range is None:
+            return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    response = web.StreamResponse(status=status, headers=headers)
+    response.content_length = end - start + 1
+    await response.prepare(request)
+    remaining = response.content_length
+    zeros = request.app["zeros"]
+    while remaining > 0:
+        chunk = zeros[:min(remaining, len(zeros))]
+        await write_throttled(response, chunk, host.bandwidth)
+        remaining -= len(chunk)
+    await response.write_eof()
+    return response
+
+
+def create_app(args) -> web.Application:
+    app = web.Application()
+    app["hosts"] = build_hosts(args)
+    app["zeros"] = memoryview(bytes(1024 * 1024))
+    app.router.add_get("/robots.txt", robots)
+    app.router.add_get("/files/{size:\\d+}", file)
+    app.router.add_get("/{name:.*}", page)
+    return app
+
+
+class BenchResolver(AbstractResolver):
+    """aiohttp resolver that sends every *.bench.test name to the loopback interface."""
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        if not host.endswith("." + BENCH_DOMAIN) and host not in ("localhost", "127.0.0.1"):
+            raise OSError(f"{host} is not a benchmark host")
+        return [{
+            "hostname": host, "host": "127.0.0.1", "port": port,
+            "family": socket.AF_INET, "proto": 0, "flags": socket.AI_NUMERICHOST,
+        }]
+
+    async def close(self):
+        pass
+
+
+def bench_resolver() -> BenchResolver:
+    return BenchResolver()
+
+
+def host_url(port, index, path="/"):
+    return f"http://host{index}.{BENCH_DOMAIN}:{port}{path}"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Synthetic multi-host web server for benchmarks")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--hosts", type=int, default=50, help="number of virtual hosts")
+    parser.add_argument("--latency", type=float, default=0.02, help="base response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="extra random latency in seconds")
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes/s per response, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--page-size", type=int, default=16 * 1024, help="size of HTML pages in bytes")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    print(f"Synthetic server with {args.hosts} hosts on http://host<N>.{BENCH_DOMAIN}:{args.port}/")
+    web.run_app(create_app(args), host="127.0.0.1", port=args.port, access_log=None, print=None)
+
+if __name__ == "__main__":
+    main()
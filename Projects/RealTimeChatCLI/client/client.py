@@ -1,39 +1,130 @@
+import argparse
 import asyncio
+import os
+import random
+import time
 import websockets
 import sys # For sys.stdin
 import json # For parsing JSON messages
+from collections import deque
+
+# Modules shared with the chat servers live in RealTimeChatCLI/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from liveness import TokenBucket
 
 # Global variable to store the client's own ID received from the server
 my_client_id = None
+# Room that typed messages are published to; every client starts in the lobby
+DEFAULT_ROOM = "lobby"
+current_room = DEFAULT_ROOM
+
+RECONNECT_DELAY = 0.5 # Seconds before the first reconnect attempt; doubled after every failure
+MAX_RECONNECT_DELAY = 30
+MAX_BATCH = 500 # Requests coalesced into one frame (the server accepts up to 1000)
+MAX_PENDING = 10000 # Requests buffered while sending lags behind before we stop reading stdin
+READ_CHUNK = 64 * 1024 # Bytes read from stdin at a time
+
+# Interactive mode prompts for input; bulk mode (stdin is not a terminal) just streams it.
+# quiet leaves out the chat messages, e.g. when the client is a load generator.
+interactive = True
+quiet = False
+
+# Rooms we are in, with the sequence number of the last message seen in each.
+# After a reconnect we rejoin them and ask the server for everything after that number.
+last_seq = {}
+history_id = None # Which server history the sequence numbers belong to
+# Rooms whose replay is still on its way; live messages for them arrive again in the replay
+pending_replay = set()
+# The server's inbound rate limit, announced in your_id. Sending faster would only make the
+# server stop reading from us (and everything queued in between would wait), so we pace ourselves.
+send_limit = None
+
+def prompt():
+    if interactive:
+        sys.stdout.write(f"You ({current_room}): ") # Prompt for user input
+        sys.stdout.flush() # Ensure the prompt is displayed immediately
+
+def show(text):
+    """Prints a line from the server, re-prompting for user input afterwards."""
+    if not quiet:
+        print(f"\n{text}" if interactive else text)
+        prompt()
+
+def track_room(room, message_data):
+    """Starts tracking the sequence numbers of room, unless we are rejoining it after a reconnect."""
+    global history_id
+    if message_data.get("history_id") is not None:
+        history_id = message_data["history_id"]
+    last_seq.setdefault(room, message_data.get("seq", 0))
+
+def set_send_limit(message_data):
+    global send_limit
+    rate = message_data.get("rate_limit")
+    send_limit = TokenBucket(rate, message_data.get("rate_burst") or rate, time.monotonic()) if rate else None
+
+def print_chat_message(message_data):
+    sender_id = message_data.get("sender_id")
+    # Only print the message if it's from another sender;
+    # our own messages were already seen when we typed them.
+    if sender_id != my_client_id:
+        show(f"({message_data.get('room', DEFAULT_ROOM)}) [{sender_id}] {message_data.get('message')}")
+
+def handle_history(message_data):
+    """Prints the messages we missed while disconnected, sent by the server as one frame."""
+    room = message_data.get("room")
+    pending_replay.discard(room)
+    since = 0 if message_data.get("reset") else last_seq.get(room, 0)
+    messages = [m for m in message_data.get("messages", []) if m.get("seq", 0) > since]
+    if messages and messages[0].get("seq", 0) > since + 1 and since:
+        show(f"({room}) Some older messages are no longer available")
+    for inner_message in messages:
+        print_chat_message(inner_message)
+    last_seq[room] = message_data.get("last_seq", 0)
+
+def handle_message(message_data):
+    """Prints one message from the server; batch frames are unpacked recursively."""
+    global my_client_id
+    message_type = message_data.get("type")
+    if message_type == "your_id":
+        # This is the special message telling us our own ID
+        my_client_id = message_data.get("id")
+        track_room(message_data.get("room", DEFAULT_ROOM), message_data)
+        set_send_limit(message_data)
+        show(f"Your unique chat ID: {my_client_id}")
+    elif message_type == "batch":
+        # The server coalesced several pending messages because we fell behind
+        for inner_message in message_data.get("messages", []):
+            handle_message(inner_message)
+    elif message_type == "history":
+        handle_history(message_data)
+    elif message_type in ("joined", "left"):
+        room = message_data.get("room")
+        if message_type == "joined":
+            track_room(room, message_data)
+        else:
+            last_seq.pop(room, None)
+        show(f"{message_type.capitalize()} room {room}")
+    elif message_type == "error":
+        # A failed join or replay means the replay we wait for is not coming
+        pending_replay.discard(message_data.get("room"))
+        show(f"Server error: {message_data.get('message')}")
+    elif message_type == "chat_message":
+        room = message_data.get("room", DEFAULT_ROOM)
+        if room in pending_replay:
+            return # Part of the replay we are waiting for
+        if room in last_seq:
+            last_seq[room] = max(last_seq[room], message_data.get("seq", 0))
+        print_chat_message(message_data)
 
 async def receive_messages(websocket):
     """
     Continuously listens for messages from the WebSocket server,
     parses them, and prints only messages from other users.
     """
-    global my_client_id
     try:
         async for message_json in websocket:
             try:
-                message_data = json.loads(message_json)
-
-                if message_data.get("type") == "your_id":
-                    # This is the special message telling us our own ID
-                    my_client_id = message_data.get("id")
-                    print(f"Your unique chat ID: {my_client_id}")
-                    sys.stdout.write("You: ") # Re-prompt after showing ID
-                    sys.stdout.flush()
-                elif message_data.get("type") == "chat_message":
-                    sender_id = message_data.get("sender_id")
-                    message_content = message_data.get("message")
-
-                    # Only print the message if it's from another sender
-                    if sender_id != my_client_id:
-                        print(f"\n[{sender_id}] {message_content}")
-                        sys.stdout.write("You: ") # Re-prompt for user input after receiving a message
-                        sys.stdout.flush() # Ensure the prompt is displayed immediately
-                    # If it's our own message, we don't print it here
-                    # because we've already seen it when we typed it.
+                handle_message(json.loads(message_json))
             except json.JSONDecodeError:
                 print(f"Received malformed JSON: {message_json}")
             except Exception as e:
@@ -43,46 +134,210 @@ async def receive_messages(websocket):
     except Exception as e:
         print(f"Error receiving message: {e}")
 
-async def send_messages(websocket):
+class Outbox:
+    """
+    Requests waiting to be sent. They are kept across reconnects, and the sender takes
+    everything queued so far at once, so lines typed or piped in quickly share a frame.
     """
-    Continuously prompts the user for input and sends it to the WebSocket server.
-    Note: The message is not printed immediately here; it will be displayed
-    when received back from the server (if it's from another client).
+    def __init__(self, max_pending=MAX_PENDING):
+        self.requests = deque()
+        self.max_pending = max_pending
+        self.ready = asyncio.Event() # Something to send
+        self.space = asyncio.Event() # Below max_pending
+        self.space.set()
+        self.idle = asyncio.Event() # Nothing queued or being sent
+        self.idle.set()
+
+    async def put_many(self, requests):
+        await self.space.wait()
+        self.requests.extend(requests)
+        if self.requests:
+            self.ready.set()
+            self.idle.clear()
+        if len(self.requests) >= self.max_pending:
+            self.space.clear()
+
+    def take(self, limit):
+        batch = [self.requests.popleft() for _ in range(min(limit, len(self.requests)))]
+        if not self.requests:
+            self.ready.clear()
+        if len(self.requests) < self.max_pending:
+            self.space.set()
+        return batch
+
+    def put_back(self, batch):
+        """Returns a batch that could not be sent to the front, to go out after reconnecting."""
+        self.requests.extendleft(reversed(batch))
+        self.ready.set()
+
+    def sent(self):
+        if not self.requests:
+            self.idle.set()
+
+def parse_line(line):
+    """
+    Turns one input line into a request. Lines starting with /join, /leave or /room
+    manage rooms; anything else is published to the current room.
+    """
+    global current_room
+    command, _, room = line.partition(" ")
+    room = room.strip()
+    if command in ("/join", "/leave", "/room") and room:
+        request = {"type": command[1:], "room": room} if command != "/room" else None
+        if command != "/leave":
+            current_room = room
+        elif room == current_room:
+            current_room = DEFAULT_ROOM
+        return request
+    if line: # Only send if the message is not empty
+        return {"type": "publish", "room": current_room, "message": line}
+    return None
+
+async def open_stdin():
     """
+    Returns a coroutine function reading up to n bytes of stdin. Pipes are watched by the
+    event loop, without a thread per read; terminals and regular files are read in a thread.
+    """
+    read_in_thread = lambda n: asyncio.to_thread(sys.stdin.buffer.read1, n)
+    if sys.stdin.isatty():
+        # connect_read_pipe would make the terminal non-blocking, and stdout shares it:
+        # prints could then fail with BlockingIOError
+        return read_in_thread
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
     try:
-        while True:
-            sys.stdout.write("You: ") # Prompt for user input
-            sys.stdout.flush() # Ensure the prompt is displayed immediately
-            message = await asyncio.to_thread(sys.stdin.readline) # Read line from stdin in a non-blocking way
-            message = message.strip() # Remove newline character
-
-            if message: # Only send if the message is not empty
-                await websocket.send(message)
-            await asyncio.sleep(0.1) # Small delay to prevent busy-waiting
-    except websockets.exceptions.ConnectionClosedOK:
-        print("Connection closed by the server.")
-    except Exception as e:
-        print(f"Error sending message: {e}")
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        return reader.read
+    except ValueError:
+        # Regular files (stdin redirected from a file) can't be watched by the event loop
+        return read_in_thread
 
-async def chat_client():
+async def read_input(outbox):
+    """
+    Reads stdin in chunks and queues a request for every complete line. A terminal hands
+    us one line per read; a pipe hands us as many lines as are waiting, all queued at once.
+    """
+    read = await open_stdin()
+    partial = b""
+    while chunk := await read(READ_CHUNK):
+        lines = (partial + chunk).split(b"\n")
+        partial = lines.pop() # An incomplete last line waits for the next chunk
+        requests = [parse_line(line.decode(errors="replace").strip()) for line in lines]
+        await outbox.put_many([request for request in requests if request is not None])
+        prompt()
+    last_request = parse_line(partial.decode(errors="replace").strip())
+    if last_request is not None:
+        await outbox.put_many([last_request])
+
+async def send_requests(websocket, outbox, max_batch=MAX_BATCH):
+    """
+    Sends queued requests as they come. While one frame is being written, new requests
+    pile up in the outbox and go out together in the next one. No faster than the
+    server's rate limit, which every request in a batch counts against.
+    Note: Our own messages are not printed here; the server echoes them to us but
+    they are skipped since we've already seen them when we typed them.
+    """
+    while True:
+        await outbox.ready.wait()
+        limit = send_limit
+        batch = outbox.take(max_batch if limit is None else max(1, min(max_batch, int(limit.burst))))
+        frame = batch[0] if len(batch) == 1 else {"type": "batch", "requests": batch}
+        try:
+            if limit is not None:
+                delay = limit.delay(time.monotonic(), len(batch))
+                if delay:
+                    await asyncio.sleep(delay)
+            await websocket.send(json.dumps(frame))
+        except BaseException:
+            outbox.put_back(batch) # Connection lost (or we were cancelled): send again later
+            raise
+        outbox.sent()
+
+async def resume(websocket, rooms, known_history_id):
+    """
+    After a reconnect, rejoins the rooms we were in and asks for the messages
+    published since the last one we saw in each.
+    """
+    if DEFAULT_ROOM not in rooms:
+        await websocket.send(json.dumps({"type": "leave", "room": DEFAULT_ROOM}))
+    for room, seq in rooms.items():
+        if room != DEFAULT_ROOM: # The server puts us back in the lobby by itself
+            await websocket.send(json.dumps({"type": "join", "room": room}))
+        if known_history_id is not None:
+            pending_replay.add(room)
+            await websocket.send(json.dumps({
+                "type": "replay", "room": room, "since": seq, "history_id": known_history_id,
+            }))
+
+async def input_finished(input_task, outbox):
+    """Completes once stdin is exhausted and everything read from it has been sent."""
+    await asyncio.wait({input_task})
+    await outbox.idle.wait()
+
+async def chat_client(uri="ws://localhost:8765", max_batch=MAX_BATCH):
     """
     Connects to the WebSocket server and runs concurrent tasks for sending and receiving messages.
+    When the connection drops, it reconnects with exponential backoff and catches up on the
+    messages it missed. Returns once stdin is exhausted and all of it has been sent.
     """
-    uri = "ws://localhost:8765"
-    try:
-        async with websockets.connect(uri) as websocket:
-            print(f"Connected to WebSocket chat server at {uri}. Waiting for your ID...")
-
-            # Run sending and receiving tasks concurrently.
-            await asyncio.gather(
-                receive_messages(websocket),
-                send_messages(websocket)
-            )
-    except ConnectionRefusedError:
-        print(f"Connection refused. Is the server running at {uri}?")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    outbox = Outbox()
+    input_task = asyncio.create_task(read_input(outbox))
+    finished = asyncio.create_task(input_finished(input_task, outbox))
+    if current_room != DEFAULT_ROOM:
+        await outbox.put_many([{"type": "join", "room": current_room}])
 
-if __name__ == "__main__":
-    asyncio.run(chat_client())
+    delay = RECONNECT_DELAY
+    connected_before = False
+    while True:
+        try:
+            async with websockets.connect(uri, max_queue=None) as websocket:
+                if not connected_before:
+                    print(f"Connected to WebSocket chat server at {uri}. Waiting for your ID...")
+                    if interactive:
+                        print("Commands: /join <room>, /leave <room>, /room <room> (switch without joining)")
+                else:
+                    print(f"\nReconnected to {uri}.")
+                    pending_replay.clear()
+                    await resume(websocket, dict(last_seq), history_id)
+                connected_before = True
+                delay = RECONNECT_DELAY
+
+                # Run sending and receiving concurrently until the connection ends or we're done
+                sender = asyncio.create_task(send_requests(websocket, outbox, max_batch))
+                receiver = asyncio.create_task(receive_messages(websocket))
+                await asyncio.wait({sender, receiver, finished}, return_when=asyncio.FIRST_COMPLETED)
+                for task in (sender, receiver):
+                    task.cancel()
+                await asyncio.gather(sender, receiver, return_exceptions=True)
+                if finished.done():
+                    return # Leaving the block closes the connection after what we sent
+        except (OSError, websockets.exceptions.InvalidHandshake, asyncio.TimeoutError):
+            print(f"Connection failed. Is the server running at {uri}?")
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        # Back off exponentially, with jitter so many clients don't reconnect in lockstep
+        print(f"Reconnecting in {delay:.1f}s...")
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="WebSocket chat client")
+    parser.add_argument("--uri", default="ws://localhost:8765")
+    parser.add_argument("--room", default=DEFAULT_ROOM, help="room to join and publish to")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--bulk", action="store_true", default=None,
+                      help="publish every stdin line without prompting (default when stdin is not a terminal)")
+    mode.add_argument("--interactive", action="store_false", dest="bulk")
+    parser.add_argument("--quiet", action="store_true", help="don't print chat messages")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="requests coalesced into one frame")
+    return parser.parse_args()
 
+if __name__ == "__main__":
+    args = parse_args()
+    interactive = not args.bulk if args.bulk is not None else sys.stdin.isatty()
+    quiet = args.quiet
+    current_room = args.room
+    try:
+        asyncio.run(chat_client(args.uri, args.max_batch))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,161 @@
+# chatlog.py
+# Logging for both chat servers that stays off the event loop. log.log(category, fmt,
+# *args) counts the event and decides cheaply whether to write it at all (per-category
+# sampling and rate limits); lines that are wanted go on a bounded queue as (fmt, args),
+# and a background thread formats and writes whatever has piled up in one go. A slow
+# terminal or log collector then only holds up that thread, and when the queue is full
+# lines are dropped and counted instead of blocking. Per-message events are only counted
+# by default and show up in a stats line of counters every stats interval.
+import argparse
+import queue
+import sys
+import threading
+import time
+
+from liveness import TokenBucket
+
+DEFAULT_CATEGORY = (1.0, 0.0) # (fraction of events written, max lines per second or 0 for no limit)
+QUEUE_SIZE = 10000 # Lines waiting for the writer thread
+BATCH_SIZE = 512 # Lines written together at most
+STATS_INTERVAL = 10.0
+
+class Category:
+    """Which events of one kind are written: every nth one, at most rate lines per second."""
+    __slots__ = ("every", "seen", "limit")
+
+    def __init__(self, fraction, rate):
+        self.every = round(1 / fraction) if fraction > 0 else 0 # Deterministic sampling, no random() per event
+        self.seen = 0
+        self.limit = TokenBucket(rate, max(1.0, rate), time.monotonic()) if rate > 0 else None
+
+class Logger:
+    def __init__(self, categories=None, stream=None, stats_interval=STATS_INTERVAL, enabled=True,
+                 queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        self.categories = {name: Category(*setting) for name, setting in (categories or {}).items()}
+        self.stream = stream
+        self.stats_interval = stats_interval
+        self.enabled = enabled
+        self.queue = queue.Queue(queue_size)
+        self.batch_size = batch_size
+        self.counters = {}
+        self.thread = None
+
+    def count(self, name, n=1):
+        counters = self.counters
+        counters[name] = counters.get(name, 0) + n
+
+    def log(self, category, fmt, *args):
+        """
+        Counts an event of category and queues its line if sampling and the rate limit let
+        it through. Formatting happens in the writer thread; bytes arguments are decoded there.
+        """
+        counters = self.counters
+        counters[category] = counters.get(category, 0) + 1
+        if not self.enabled:
+            return
+        settings = self.categories.get(category)
+        if settings is None:
+            settings = self.categories[category] = Category(*DEFAULT_CATEGORY)
+        if not settings.every:
+            return
+        settings.seen += 1
+        if settings.seen % settings.every:
+            return
+        if settings.limit is not None and not settings.limit.take(time.monotonic()):
+            self.count("log_rate_limited")
+            return
+        try:
+            self.queue.put_nowait((fmt, args))
+        except queue.Full:
+            self.count("log_dropped")
+
+    def start(self):
+        if self.enabled and self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="chatlog", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Writes what is still queued plus a last stats line, and stops the writer thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _run(self):
+        stream = self.stream or sys.stdout
+        last_counters = {}
+        next_stats = time.monotonic() + self.stats_interval if self.stats_interval > 0 else None
+        stopping = False
+        while not stopping:
+            timeout = None if next_stats is None else max(0.0, next_stats - time.monotonic())
+            try:
+                entries = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                entries = []
+            # Everything else that piled up meanwhile goes out in the same write
+            while entries and len(entries) < self.batch_size:
+                try:
+                    entries.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for entry in entries:
+                if entry is None:
+                    stopping = True
+                    continue
+                lines.append(format_line(*entry))
+            if stopping or (next_stats is not None and time.monotonic() >= next_stats):
+                # A copy made in one go (dict() doesn't run Python code), so the loop can keep counting
+                counters = dict(self.counters)
+                if counters != last_counters:
+                    lines.append(stats_line(counters, last_counters))
+                last_counters = counters
+                if next_stats is not None:
+                    next_stats = time.monotonic() + self.stats_interval
+            if lines:
+                try:
+                    stream.write("".join(lines))
+                    stream.flush()
+                except (OSError, ValueError):
+                    pass # Nowhere left to log to; keep draining so callers never notice
+
+def stats_line(counters, last_counters):
+    """Counter increments since the previous stats line, e.g. 'stats connect=3 receive=1200'."""
+    changes = " ".join(
+        f"{name}={value - last_counters.get(name, 0)}" for name, value in sorted(counters.items())
+        if value != last_counters.get(name, 0)
+    )
+    return f"stats {changes}\n"
+
+def format_line(fmt, args):
+    try:
+        return (fmt % tuple(arg.decode(errors="replace") if isinstance(arg, bytes) else arg for arg in args)) + "\n"
+    except (TypeError, ValueError) as e:
+        return f"{fmt!r} {args!r} (unformattable: {e})\n"
+
+def category_setting(text):
+    """Parses CATEGORY=VALUE for --log-sample and --log-rate."""
+    name, _, value = text.partition("=")
+    try:
+        return name, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected CATEGORY=NUMBER, got {text!r}")
+
+def add_log_arguments(parser):
+    parser.add_argument("--quiet", action="store_true", help="write no log lines at all")
+    parser.add_argument("--log-sample", type=category_setting, action="append", default=[], metavar="CATEGORY=FRACTION",
+                        help="write this fraction of the category's events, e.g. receive=0.01")
+    parser.add_argument("--log-rate", type=category_setting, action="append", default=[], metavar="CATEGORY=LINES",
+                        help="write at most this many lines per second of the category, 0 for no limit")
+    parser.add_argument("--log-stats-interval", type=float, default=STATS_INTERVAL,
+                        help="seconds between stats lines of counters, 0 for none")
+
+def logger_from_args(categories, args):
+    """A Logger with the default categories overridden by --log-sample and --log-rate."""
+    categories = dict(categories)
+    for name, fraction in args.log_sample:
+        categories[name] = (fraction, categories.get(name, DEFAULT_CATEGORY)[1])
+    for name, rate in args.log_rate:
+        categories[name] = (categories.get(name, DEFAULT_CATEGORY)[0], rate)
+    return Logger(categories, stats_interval=args.log_stats_interval, enabled=not args.quiet)
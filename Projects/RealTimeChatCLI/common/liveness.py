@@ -0,0 +1,77 @@
+# liveness.py
+# Finding dead clients and throttling busy ones without a timer per connection, for both
+# chat servers (server/ and other/). The client paces itself with TokenBucket too.
+#
+# TimingWheel is a hashed timing wheel: a ring of slots one tick apart, turned by a single
+# task. A connection is only ever in one slot, and it's scheduled lazily: handlers just
+# note when they last heard from the client, and when the slot comes round the check
+# decides whether to ping, evict or schedule itself again. Hearing from a client costs
+# one attribute assignment instead of moving it between slots.
+import asyncio
+import math
+
+class TimingWheel:
+    """Calls on_due(item) roughly delay seconds after schedule(item, delay), to tick precision."""
+    def __init__(self, on_due, tick=1.0, slots=64):
+        self.on_due = on_due
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.position = 0
+        self.task = None
+
+    def schedule(self, item, delay):
+        # Delays past one revolution are cut short; the lazy check just schedules itself again
+        ticks = min(max(1, math.ceil(delay / self.tick)), len(self.slots) - 1)
+        self.slots[(self.position + ticks) % len(self.slots)].append(item)
+
+    def advance(self):
+        """Moves to the next slot and hands out everything due in it."""
+        self.position = (self.position + 1) % len(self.slots)
+        due = self.slots[self.position]
+        self.slots[self.position] = []
+        for item in due:
+            self.on_due(item)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time())) # No drift from slow ticks
+            self.advance()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots)
+
+class TokenBucket:
+    """Allows rate requests per second on average, in bursts of up to burst."""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def delay(self, now, cost=1):
+        """Takes cost tokens and returns how long to wait before acting on them (0 if there were enough)."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - cost
+        self.updated = now
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def take(self, now, cost=1):
+        """Takes cost tokens if there are enough and tells whether there were; never borrows ahead."""
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < cost:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - cost
+        return True
@@ -1,4 +1,8 @@
+import argparse
 import asyncio
+import itertools
+
+from protocol import HEARTBEAT_LINE, HELLO, HELLO_LINE, MESSAGE, PING, PONG, encode_frame, read_frames
 
 async def send_messages(writer):
     while True:
@@ -6,21 +10,53 @@ async def send_messages(writer):
         writer.write(f"{msg}\n".encode())
         await writer.drain()
 
-async def receive_messages(reader):
+async def receive_messages(reader, writer):
     while True:
         data = await reader.readline()
         if not data:
             break
+        if data == HEARTBEAT_LINE:
+            writer.write(HEARTBEAT_LINE) # Tell the server we're still here
+            continue
         print(data.decode().strip())
 
-async def main():
-    reader, writer = await asyncio.open_connection("localhost", 8888)
+async def send_frames(writer):
+    """Binary protocol: every input line goes out as one message frame."""
+    seqs = itertools.count(1)
+    while True:
+        msg = await asyncio.get_event_loop().run_in_executor(None, input)
+        writer.write(encode_frame(MESSAGE, 0, next(seqs), msg.encode()))
+        await writer.drain()
+
+async def receive_frames(reader, writer):
+    async for frame_type, sender, seq, payload in read_frames(reader):
+        if frame_type == PING:
+            writer.write(encode_frame(PONG, 0, 0))
+        elif frame_type == HELLO:
+            print(f"Speaking the binary protocol as sender {sender} ({payload.decode()})")
+        elif frame_type == MESSAGE:
+            print(f"[{sender} #{seq}] {payload.decode(errors='replace')}")
+
+async def main(host="localhost", port=8888, binary=False):
+    reader, writer = await asyncio.open_connection(host, port)
     print("Connected to chat!")
 
-    await asyncio.gather(
-        send_messages(writer),
-        receive_messages(reader)
-    )
+    if binary:
+        writer.write(HELLO_LINE) # Ask the server to switch this connection to frames
+        await asyncio.gather(
+            send_frames(writer),
+            receive_frames(reader, writer)
+        )
+    else:
+        await asyncio.gather(
+            send_messages(writer),
+            receive_messages(reader, writer)
+        )
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="asyncio TCP chat client")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--binary", action="store_true", help="use length-prefixed frames instead of text lines")
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.binary))
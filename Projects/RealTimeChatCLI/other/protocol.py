@@ -0,0 +1,58 @@
+# protocol.py
+# Binary framing for the TCP chat, used instead of newline-delimited text by clients
+# that ask for it. A client opts in by sending HELLO_LINE as its very first line (text
+# clients can't type a NUL byte); the server answers with a HELLO frame carrying the
+# client's sender id, and from then on both sides speak frames:
+#
+#   [u32 length of the rest][u8 type][u32 sender id][u64 seq][payload]
+#
+# Messages from the server carry the sender's id and a server-wide sequence number;
+# clients send 0 as sender id and number their own messages.
+#
+# Heartbeats: the server sends PING to peers it hasn't heard from for a while and
+# drops those that stay silent; clients answer with PONG. Text clients get an empty
+# line instead and answer with an empty line.
+import struct
+
+HELLO_LINE = b"\x00CHAT-BINARY/1\n"
+HEARTBEAT_LINE = b"\n"
+
+FRAME = struct.Struct("!IBIQ")
+LENGTH = struct.Struct("!I")
+HEADER_SIZE = FRAME.size - LENGTH.size # Counted in the length prefix
+MAX_FRAME_SIZE = 1024 * 1024
+READ_CHUNK = 64 * 1024
+
+HELLO = 0
+MESSAGE = 1
+PING = 2
+PONG = 3
+
+class FrameError(Exception):
+    pass
+
+def encode_frame(frame_type, sender, seq, payload=b""):
+    return FRAME.pack(HEADER_SIZE + len(payload), frame_type, sender, seq) + payload
+
+async def read_frames(reader, buffer=b""):
+    """
+    Yields (type, sender, seq, payload) for every frame from reader. Reads whatever
+    has arrived, up to READ_CHUNK, and slices all the complete frames out of it, so a
+    burst of small frames costs one read instead of two per frame.
+    """
+    while True:
+        offset = 0
+        while len(buffer) - offset >= FRAME.size:
+            length, frame_type, sender, seq = FRAME.unpack_from(buffer, offset)
+            if not HEADER_SIZE <= length <= MAX_FRAME_SIZE:
+                raise FrameError(f"Invalid frame length {length}")
+            end = offset + LENGTH.size + length
+            if end > len(buffer):
+                break # The rest of this frame hasn't arrived yet
+            yield frame_type, sender, seq, buffer[offset + FRAME.size:end]
+            offset = end
+        buffer = buffer[offset:]
+        data = await reader.read(READ_CHUNK)
+        if not data:
+            return
+        buffer = buffer + data if buffer else data
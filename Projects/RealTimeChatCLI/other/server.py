@@ -1,35 +1,306 @@
+import argparse
 import asyncio
+import itertools
+import os
+import socket
+import sys
+from collections import deque
+
+# Modules shared by the chat servers and the client live in RealTimeChatCLI/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from chatlog import Logger, add_log_arguments, logger_from_args
+from liveness import TimingWheel, TokenBucket
+from protocol import HEARTBEAT_LINE, HELLO, HELLO_LINE, MESSAGE, PING, FrameError, encode_frame, read_frames
+
+# Per-peer output limits. The transport buffer pauses the peer's writer task above
+# HIGH_WATER and resumes it below LOW_WATER; messages wait in the peer's queue meanwhile.
+# A peer with more than MAX_BUFFERED bytes waiting, or whose buffer doesn't drain for
+# SLOW_CONSUMER_TIMEOUT seconds, is a slow consumer and gets disconnected.
+HIGH_WATER = 64 * 1024
+LOW_WATER = 16 * 1024
+MAX_BUFFERED = 1024 * 1024
+SLOW_CONSUMER_TIMEOUT = 5.0
+BACKLOG = 1024 # Pending connections the kernel queues while we accept, for bursts of clients
+ACCEPT_RETRY_DELAY = 0.1 # Pause after a failed accept (e.g. out of file descriptors) before trying again
+
+# Peers we haven't heard from for HEARTBEAT_INTERVAL seconds get a heartbeat, and those
+# still silent after IDLE_TIMEOUT are dropped (half-open connections never answer).
+HEARTBEAT_INTERVAL = 30.0
+IDLE_TIMEOUT = 90.0
+# With MAX_CONNECTIONS peers connected we stop accepting; newcomers wait in the backlog.
+MAX_CONNECTIONS = 10000
+# Lines or frames per second read from each peer, and the burst allowed above that.
+# A peer over its limit isn't read from until it's back under.
+RATE_LIMIT = 200.0
+RATE_BURST = 400
+
+# Log lines per event category: (fraction of events written, max lines per second, 0 for
+# no limit). Messages are only counted by default; the counts go out in a stats line
+# every --log-stats-interval seconds. See chatlog.py.
+LOG_CATEGORIES = {
+    "server": (1.0, 0.0),
+    "connect": (1.0, 20.0),
+    "disconnect": (1.0, 20.0),
+    "receive": (0.0, 20.0),
+    "slow_consumer": (1.0, 10.0),
+    "idle_drop": (1.0, 10.0),
+    "error": (1.0, 10.0),
+}
+
+heartbeat_interval = HEARTBEAT_INTERVAL
+idle_timeout = IDLE_TIMEOUT
+max_connections = MAX_CONNECTIONS
+rate_limit = RATE_LIMIT
+rate_burst = RATE_BURST
+liveness_wheel = None
+log = Logger(LOG_CATEGORIES) # Writes from a background thread, see chatlog.py
+
+peer_ids = itertools.count(1)
+message_seqs = itertools.count(1) # Server-wide sequence numbers of binary messages
+
+class Peer:
+    """One connected client, with its own queue and a writer task that flushes it."""
+    __slots__ = (
+        "writer", "addr", "id", "label", "binary", "queue", "queued_bytes", "wakeup", "task", "closed",
+        "last_seen", "rate_limit",
+    )
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.id = next(peer_ids)
+        self.label = str(self.addr).encode() # How text clients see this peer
+        self.binary = False # Speaks the framed protocol instead of lines
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        now = asyncio.get_running_loop().time()
+        self.last_seen = now
+        self.rate_limit = TokenBucket(rate_limit, rate_burst, now) if rate_limit > 0 else None
+        writer.transport.set_write_buffer_limits(high=HIGH_WATER, low=LOW_WATER)
+        self.task = asyncio.create_task(self._writer())
+
+    def send(self, data):
+        """Queues data without waiting; a peer that has fallen too far behind is evicted instead."""
+        if self.closed:
+            return
+        self.queue.append(data)
+        self.queued_bytes += len(data)
+        if self.queued_bytes + self.writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+            self.evict(f"more than {MAX_BUFFERED} bytes waiting")
+            return
+        self.wakeup.set()
+
+    async def _writer(self):
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                # Everything queued since the last write goes out together in one syscall
+                batch = list(self.queue)
+                self.queue.clear()
+                self.queued_bytes = 0
+                self.writer.writelines(batch)
+                await asyncio.wait_for(self.writer.drain(), SLOW_CONSUMER_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.evict(f"output not drained for {SLOW_CONSUMER_TIMEOUT}s")
+        except ConnectionError:
+            pass # The peer's reader notices the disconnect and cleans up
+
+    def evict(self, reason):
+        """Drops a slow consumer: stops delivering to it right away and aborts its connection."""
+        if self.closed:
+            return
+        log.log("slow_consumer", "Disconnecting slow consumer %s: %s", self.addr, reason)
+        self.close()
+        clients.discard(self)
+        self.writer.transport.abort()
+
+    async def heard_from(self):
+        """Notes that the peer is alive and, if it's over its rate limit, waits before reading more."""
+        now = asyncio.get_running_loop().time()
+        self.last_seen = now
+        if self.rate_limit is not None:
+            delay = self.rate_limit.delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        self.task.cancel()
+
+class Message:
+    """
+    A message from one peer, encoded at most once per protocol: every binary peer
+    gets the same frame bytes and every text peer the same line bytes.
+    """
+    __slots__ = ("sender", "payload", "_frame", "_line")
+
+    def __init__(self, sender, payload):
+        self.sender = sender
+        self.payload = payload
+        self._frame = None
+        self._line = None
+
+    def frame(self):
+        if self._frame is None:
+            self._frame = encode_frame(MESSAGE, self.sender.id, next(message_seqs), self.payload)
+        return self._frame
+
+    def line(self):
+        if self._line is None:
+            self._line = b"%s: %s\n" % (self.sender.label, self.payload.replace(b"\n", b" "))
+        return self._line
 
 clients = set()
 
+def broadcast(message, sender):
+    """Queues message for every peer except sender; nobody is waited on."""
+    # Iterate over a snapshot: evicting a peer removes it from the set
+    peers = list(clients)
+    for peer in peers:
+        if peer is not sender:
+            peer.send(message.frame() if peer.binary else message.line())
+    log.count("delivered", len(peers) - (sender in clients))
+
+async def read_text(reader, peer, data):
+    """Broadcasts every line from a text client, starting with the already read line data."""
+    while data:
+        await peer.heard_from()
+        message = data.strip()
+        if message: # Empty lines answer heartbeats
+            log.log("receive", "%s: %s", peer.addr, message)
+            broadcast(Message(peer, message), peer)
+        data = await reader.readline()
+
+async def read_binary(reader, peer):
+    """Broadcasts every message frame from a binary client; payloads are forwarded untouched."""
+    async for frame_type, _, _, payload in read_frames(reader):
+        await peer.heard_from()
+        if frame_type == MESSAGE:
+            log.log("receive", "%s: %s", peer.addr, payload)
+            broadcast(Message(peer, payload), peer)
+
+def check_liveness(peer):
+    """Runs when a peer's check comes round on the wheel: send a heartbeat, drop it, or check again later."""
+    if peer.closed:
+        return # Gone meanwhile; dropping it from the wheel is all that's left
+    idle = asyncio.get_running_loop().time() - peer.last_seen
+    if idle >= idle_timeout:
+        log.log("idle_drop", "%s sent nothing for %.0fs, dropping it.", peer.addr, idle)
+        peer.close()
+        clients.discard(peer)
+        peer.writer.transport.abort()
+        return
+    if idle >= heartbeat_interval:
+        peer.send(encode_frame(PING, 0, 0) if peer.binary else HEARTBEAT_LINE)
+        liveness_wheel.schedule(peer, min(heartbeat_interval, idle_timeout - idle))
+    else:
+        liveness_wheel.schedule(peer, heartbeat_interval - idle)
+
 async def handle_client(reader, writer):
-    addr = writer.get_extra_info("peername")
-    print(f"Connected by {addr}")
-    clients.add(writer)
+    peer = Peer(writer)
+    addr = peer.addr
+    log.log("connect", "Connected by %s", addr)
+    clients.add(peer)
+    if liveness_wheel is not None:
+        liveness_wheel.schedule(peer, heartbeat_interval)
 
     try:
-        while data := await reader.readline():
-            message = data.decode().strip()
-            print(f"{addr}: {message}")
-
-            for client in clients:
-                if client != writer:
-                    client.write(f"{addr}: {message}\n".encode())
-                    await client.drain()
+        # Binary clients announce themselves with their first line; anything else is text
+        first_line = await reader.readline()
+        if first_line == HELLO_LINE:
+            peer.binary = True
+            peer.send(encode_frame(HELLO, peer.id, 0, peer.label))
+            await read_binary(reader, peer)
+        else:
+            await read_text(reader, peer, first_line)
+    except FrameError as e:
+        log.log("error", "%s sent an invalid frame: %s", addr, e)
     except (asyncio.CancelledError, ConnectionResetError):
         pass
     finally:
-        print(f"{addr} disconnect.")
-        clients.remove(writer)
-        writer.close()
-        await writer.wait_closed()
+        log.log("disconnect", "%s disconnect.", addr)
+        clients.discard(peer)
+        peer.close()
+        if writer.transport.get_write_buffer_size():
+            writer.transport.abort() # Nobody is going to read what's left; don't wait for it to flush
+        else:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def serve_connection(sock):
+    reader, writer = await asyncio.open_connection(sock=sock)
+    await handle_client(reader, writer)
+
+async def main(host="localhost", port=8888):
+    """
+    Accepts connections ourselves rather than through asyncio.start_server, so we can
+    stop accepting at max_connections: further clients wait in the kernel's backlog
+    until a slot frees up, instead of being accepted into an overloaded server.
+    """
+    global liveness_wheel
+    if idle_timeout > 0:
+        liveness_wheel = TimingWheel(check_liveness)
+        liveness_wheel.start()
+    loop = asyncio.get_running_loop()
+    listener = socket.create_server((host, port), backlog=BACKLOG)
+    listener.setblocking(False)
+    slots = asyncio.Semaphore(max_connections)
+    connections = set()
+    log.start()
+    log.log("server", "Chat server started on %s:%s", host, port)
+    try:
+        with listener:
+            while True:
+                await slots.acquire()
+                try:
+                    sock, _ = await loop.sock_accept(listener)
+                except OSError as e:
+                    # EMFILE/ENFILE and friends: the pending connection stays queued, so wait for sockets to free up
+                    slots.release()
+                    log.log("error", "Could not accept a connection: %s", e)
+                    await asyncio.sleep(ACCEPT_RETRY_DELAY)
+                    continue
+                task = asyncio.create_task(serve_connection(sock))
+                connections.add(task) # Referenced until it finishes so it isn't garbage collected
+                task.add_done_callback(connections.discard)
+                task.add_done_callback(lambda _: slots.release())
+    finally:
+        log.stop()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="asyncio TCP chat server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL,
+                        help="send a heartbeat to peers silent for this many seconds")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="drop peers silent for this many seconds, 0 to never drop them")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS)
+    parser.add_argument("--rate-limit", type=float, default=RATE_LIMIT,
+                        help="lines or frames per second read from each peer, 0 for no limit")
+    parser.add_argument("--rate-burst", type=int, default=RATE_BURST)
+    add_log_arguments(parser)
+    return parser.parse_args()
 
-async def main():
-    server = await asyncio.start_server(handle_client, "localhost", 8888)
-    print("Chat server started on localhost:8888")
-    async with server:
-        await server.serve_forever()
+def configure(args):
+    """Applies command line settings to the module-level configuration."""
+    global heartbeat_interval, idle_timeout, max_connections, rate_limit, rate_burst, log
+    heartbeat_interval = args.heartbeat_interval
+    idle_timeout = args.idle_timeout
+    max_connections = args.max_connections
+    rate_limit = args.rate_limit
+    rate_burst = args.rate_burst
+    log = logger_from_args(LOG_CATEGORIES, args)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    configure(args)
+    asyncio.run(main(args.host, args.port))
@@ -0,0 +1,269 @@
+# bus.py
+# Pub/sub bus that lets several chat server processes share rooms.
+# A process delivers its own clients' messages locally and publishes them on the bus;
+# every other process delivers bus messages to its local subscribers only. Each bus
+# message carries the id of the process that sent it, and a process ignores its own
+# messages, so nothing is ever delivered twice.
+import asyncio
+import os
+import struct
+import uuid
+from urllib.parse import urlparse
+
+# Wire format shared by UnixSocketBus and the broker:
+# [u32 length of the rest][u16 room length][u16 origin length][room][origin][payload]
+HEADER = struct.Struct("!IHH")
+LENGTH = struct.Struct("!I")
+# The broker stops reading from a publisher while a peer has more than BROKER_HIGH_WATER
+# bytes waiting, and evicts a peer that doesn't get below that within BROKER_DRAIN_TIMEOUT,
+# so one stalled process can't make the broker buffer without limit.
+BROKER_HIGH_WATER = 4 * 1024 * 1024
+BROKER_DRAIN_TIMEOUT = 5.0
+# A bus whose connection drops (e.g. evicted by the broker) reconnects after RECONNECT_DELAY,
+# doubled after every failed attempt up to MAX_RECONNECT_DELAY. Messages published by any
+# process in between are lost for the processes that weren't connected.
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 30.0
+
+def encode_bus_message(room: str, origin: bytes, payload: bytes) -> bytes:
+    room_bytes = room.encode()
+    body_length = HEADER.size - LENGTH.size + len(room_bytes) + len(origin) + len(payload)
+    return HEADER.pack(body_length, len(room_bytes), len(origin)) + room_bytes + origin + payload
+
+def decode_bus_body(body: bytes):
+    """Splits a message body (everything after the length prefix) into room, origin and payload."""
+    room_length, origin_length = struct.unpack_from("!HH", body)
+    offset = 4
+    room = body[offset:offset + room_length].decode()
+    offset += room_length
+    origin = body[offset:offset + origin_length]
+    return room, origin, body[offset + origin_length:]
+
+class Bus:
+    """
+    Base class for bus backends. Other processes' messages are passed to the coroutine
+    on_message(room, payload). Backends implement _open() to (re)connect, returning the
+    reader, _read(reader) to receive until the connection ends, _send() and _drop().
+    """
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex.encode()
+        self.on_message = None
+        self.reader_task = None
+        self.connected = False
+
+    async def connect(self, on_message):
+        self.on_message = on_message
+        reader = await self._open()
+        self.connected = True
+        self.reader_task = asyncio.create_task(self._run(reader))
+
+    async def _run(self, reader):
+        """Reads until the connection ends, then reconnects with backoff, for as long as the bus is open."""
+        while True:
+            try:
+                await self._read(reader)
+                print("Bus connection closed, reconnecting.")
+            except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+                print(f"Bus connection lost ({e!r}), reconnecting.")
+            self.connected = False
+            self._drop()
+            delay = RECONNECT_DELAY
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    reader = await self._open()
+                    break
+                except OSError as e:
+                    print(f"Bus reconnect failed ({e!r}), retrying in {min(delay * 2, MAX_RECONNECT_DELAY):.1f}s.")
+                    self._drop()
+                    delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            self.connected = True
+            print("Bus reconnected.")
+
+    async def publish(self, room: str, payload: bytes):
+        """Hands a message to the other processes; raises ConnectionError while the bus is down."""
+        if not self.connected:
+            raise ConnectionError("bus is reconnecting")
+        await self._send(room, payload)
+
+    async def _open(self):
+        raise NotImplementedError
+
+    async def _read(self, reader):
+        raise NotImplementedError
+
+    async def _send(self, room, payload):
+        raise NotImplementedError
+
+    def _drop(self):
+        """Closes whatever is left of the current connection."""
+
+    async def _dispatch(self, room, origin, payload):
+        if origin != self.node_id: # Our own messages were already delivered locally
+            await self.on_message(room, payload)
+
+    async def close(self):
+        self.connected = False
+        if self.reader_task:
+            self.reader_task.cancel()
+        self._drop()
+
+class UnixSocketBus(Bus):
+    """Client for the built-in broker (run_broker) listening on a Unix socket."""
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.writer = None
+
+    async def _open(self):
+        reader, self.writer = await asyncio.open_unix_connection(self.path)
+        return reader
+
+    async def _read(self, reader):
+        while True:
+            (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+            await self._dispatch(*decode_bus_body(await reader.readexactly(length)))
+
+    async def _send(self, room, payload):
+        self.writer.write(encode_bus_message(room, self.node_id, payload))
+        await self.writer.drain()
+
+    def _drop(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+async def run_broker(path):
+    """
+    Runs the built-in broker: every message from one connected process is forwarded,
+    byte for byte, to all the others.
+    """
+    peers = set()
+
+    async def drain_or_evict(peer):
+        try:
+            await asyncio.wait_for(peer.drain(), BROKER_DRAIN_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            if peer in peers:
+                print(f"Bus peer stopped reading for {BROKER_DRAIN_TIMEOUT}s, disconnecting it.")
+                peers.discard(peer)
+                peer.transport.abort()
+
+    async def handle_peer(reader, writer):
+        writer.transport.set_write_buffer_limits(high=BROKER_HIGH_WATER)
+        peers.add(writer)
+        try:
+            while True:
+                prefix = await reader.readexactly(LENGTH.size)
+                (length,) = LENGTH.unpack(prefix)
+                message = prefix + await reader.readexactly(length)
+                lagging = []
+                for peer in list(peers):
+                    if peer is not writer:
+                        peer.write(message)
+                        if peer.transport.get_write_buffer_size() > BROKER_HIGH_WATER:
+                            lagging.append(peer)
+                if lagging:
+                    # Not reading meanwhile pushes back on the publisher through its socket
+                    await asyncio.gather(*(drain_or_evict(peer) for peer in lagging))
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            peers.discard(writer)
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path) # Left over from a previous run
+    server = await asyncio.start_unix_server(handle_peer, path)
+    print(f"Bus broker listening on {path}")
+    return server
+
+class RedisBus(Bus):
+    """
+    Backend for Redis or anything speaking its pub/sub commands (see redis_standin.py).
+    Speaks just enough RESP for PUBLISH and PSUBSCRIBE, so no client library is needed.
+    Channels are '<prefix><room>'; the payload is prefixed with '<origin>:'.
+    """
+    def __init__(self, url, prefix="chat:"):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.prefix = prefix
+        self.publish_writer = None
+        self.subscribe_writer = None
+        self.replies_task = None
+
+    @staticmethod
+    def _command(*parts: bytes) -> bytes:
+        encoded = [b"*%d\r\n" % len(parts)]
+        for part in parts:
+            encoded.append(b"$%d\r\n%s\r\n" % (len(part), part))
+        return b"".join(encoded)
+
+    @staticmethod
+    async def _read_reply(reader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind in (b"+", b":"):
+            return rest
+        if kind == b"-":
+            raise ConnectionError(f"Redis error: {rest.decode()}")
+        if kind == b"$":
+            length = int(rest)
+            return None if length < 0 else (await reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            return [await RedisBus._read_reply(reader) for _ in range(int(rest))]
+        raise ConnectionError(f"Unexpected Redis reply: {line!r}")
+
+    async def _open(self):
+        # Redis needs a dedicated connection for subscriptions
+        publish_reader, self.publish_writer = await asyncio.open_connection(self.host, self.port)
+        self.replies_task = asyncio.create_task(self._discard_replies(publish_reader))
+        reader, self.subscribe_writer = await asyncio.open_connection(self.host, self.port)
+        self.subscribe_writer.write(self._command(b"PSUBSCRIBE", self.prefix.encode() + b"*"))
+        await self.subscribe_writer.drain()
+        await self._read_reply(reader) # Subscription confirmation
+        return reader
+
+    async def _read(self, reader):
+        prefix_length = len(self.prefix)
+        while True:
+            reply = await self._read_reply(reader)
+            # ['pmessage', pattern, channel, data]
+            if isinstance(reply, list) and len(reply) == 4 and reply[0] == b"pmessage":
+                origin, _, payload = reply[3].partition(b":")
+                await self._dispatch(reply[2][prefix_length:].decode(), origin, payload)
+
+    async def _discard_replies(self, reader):
+        """PUBLISH commands are pipelined; their replies (receiver counts) are read and dropped here."""
+        try:
+            while True:
+                await self._read_reply(reader)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f"Bus publish connection closed: {e}")
+            if self.subscribe_writer:
+                self.subscribe_writer.close() # Ends _read, which reconnects both connections
+
+    async def _send(self, room, payload):
+        channel = self.prefix.encode() + room.encode()
+        self.publish_writer.write(self._command(b"PUBLISH", channel, self.node_id + b":" + payload))
+        await self.publish_writer.drain()
+
+    def _drop(self):
+        if self.replies_task:
+            self.replies_task.cancel()
+            self.replies_task = None
+        for writer in (self.publish_writer, self.subscribe_writer):
+            if writer:
+                writer.close()
+        self.publish_writer = self.subscribe_writer = None
+
+def create_bus(kind, path=None, url=None):
+    if kind == "unix":
+        return UnixSocketBus(path)
+    if kind == "redis":
+        return RedisBus(url)
+    raise ValueError(f"Unknown bus backend: {kind}")
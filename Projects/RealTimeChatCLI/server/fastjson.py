@@ -0,0 +1,24 @@
+# fastjson.py
+# Compatibility shim: uses orjson when it is installed and the standard library otherwise.
+# Both produce valid JSON, but orjson leaves out the optional whitespace and does not
+# escape non-ASCII characters, so byte-for-byte output differs between the two.
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps_bytes(obj) -> bytes:
+    """Serializes obj to UTF-8 encoded JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def loads(data):
+    """Parses JSON from str or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+BACKEND = "orjson" if orjson is not None else "json"
@@ -0,0 +1,38 @@
+# frames.py
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import Frame, Opcode
+
+class PreparedMessage:
+    """
+    A text message that is serialized and framed once, then written as the same bytes
+    to every connection that receives it.
+
+    Server-to-client frames are never masked, so one uncompressed frame is valid on
+    every connection. A compressed frame can be shared between connections that
+    negotiated permessage-deflate without server context takeover and with the same
+    window size, because each message is then compressed independently.
+    """
+    __slots__ = ("payload", "_frames")
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+        self._frames = {} # { window bits or None: serialized frame }
+
+    def frame(self, deflate: PerMessageDeflate = None) -> bytes:
+        key = deflate.local_max_window_bits if deflate is not None else None
+        frame = self._frames.get(key)
+        if frame is None:
+            extensions = [deflate] if deflate is not None else []
+            frame = Frame(Opcode.TEXT, self.payload).serialize(mask=False, extensions=extensions)
+            self._frames[key] = frame
+        return frame
+
+def shareable_deflate(websocket):
+    """
+    Returns the connection's permessage-deflate extension if frames compressed for
+    another connection can be reused on it, or None to send uncompressed frames.
+    """
+    for extension in websocket.protocol.extensions:
+        if isinstance(extension, PerMessageDeflate) and extension.local_no_context_takeover:
+            return extension
+    return None
@@ -0,0 +1,247 @@
+# history.py
+# Per-room message history for replaying what a client missed while it was disconnected.
+# Every message published to a room gets the room's next sequence number, and the last
+# HISTORY_SIZE messages of each room are kept in a fixed-size ring buffer. The ring
+# buffers hold either the encoded payloads themselves (MemoryStore) or offsets into a
+# memory-mapped append-only log (MmapLog), which survives restarts and keeps the
+# payloads out of the Python heap.
+# At most MAX_ROOMS rooms are kept (the least recently used one goes first), and prune()
+# drops rooms that nobody here is in and that have been quiet for ROOM_TTL seconds.
+import mmap
+import os
+import struct
+import time
+import uuid
+from collections import OrderedDict
+
+from fastjson import dumps_bytes
+
+HISTORY_SIZE = 100 # Messages kept per room
+MAX_ROOMS = 1000 # Rooms whose history is kept
+ROOM_TTL = 3600.0 # Seconds an unused room's history is kept after its last message
+
+class RoomHistory:
+    """Fixed-size ring buffer of (seq, handle) for the most recent messages of one room."""
+    __slots__ = ("size", "entries", "first_seq", "next_seq", "last_used")
+
+    def __init__(self, size, first_seq=1):
+        self.size = size
+        self.entries = [None] * size
+        self.first_seq = first_seq
+        self.next_seq = first_seq
+        self.last_used = time.monotonic()
+
+    def append(self, seq, handle):
+        self.entries[seq % self.size] = (seq, handle)
+        self.next_seq = seq + 1
+
+    def oldest_seq(self):
+        return max(self.first_seq, self.next_seq - self.size)
+
+    def since(self, seq):
+        """Handles of the retained messages with a sequence number greater than seq, oldest first."""
+        first = max(seq + 1, self.oldest_seq())
+        return [self.entries[s % self.size][1] for s in range(first, self.next_seq)]
+
+    def items(self):
+        return [self.entries[s % self.size] for s in range(self.oldest_seq(), self.next_seq)]
+
+class MemoryStore:
+    """Keeps payloads in memory; the history is lost when the server stops."""
+    def __init__(self):
+        self.history_id = uuid.uuid4().hex
+
+    def put(self, room, seq, payload):
+        return payload
+
+    def get(self, handle):
+        return handle
+
+    def load(self):
+        return []
+
+    def rewrite(self, entries):
+        return [payload for _, _, payload in entries]
+
+    def close(self):
+        pass
+
+class LogFull(Exception):
+    pass
+
+class MmapLog:
+    """
+    Append-only log of (room, seq, payload) records in a memory-mapped file.
+
+    Layout: a header (magic, write offset, history id) followed by records of
+    [u32 payload length][u16 room length][u64 seq][room][payload].
+    When the file is full, History rewrites it with only the messages still held
+    in the ring buffers, so the file never grows past what the history retains.
+    """
+    MAGIC = b"CHATLOG1"
+    HEADER = struct.Struct("!8sQ32s")
+    RECORD = struct.Struct("!IHQ")
+
+    def __init__(self, path, capacity=64 * 1024 * 1024):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= self.HEADER.size
+        self.file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self.file.truncate(capacity)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+        magic, self.write_offset, history_id = self.HEADER.unpack_from(self.mm, 0)
+        if magic != self.MAGIC:
+            self.write_offset = self.HEADER.size
+            history_id = uuid.uuid4().hex.encode()
+            self._write_header(history_id)
+        self.history_id = history_id.decode()
+
+    @property
+    def capacity(self):
+        return len(self.mm)
+
+    def _write_header(self, history_id):
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.write_offset, history_id)
+
+    def put(self, room, seq, payload):
+        room_bytes = room.encode()
+        offset = self.write_offset
+        end = offset + self.RECORD.size + len(room_bytes) + len(payload)
+        if end > self.capacity:
+            raise LogFull()
+        self.RECORD.pack_into(self.mm, offset, len(payload), len(room_bytes), seq)
+        payload_offset = offset + self.RECORD.size + len(room_bytes)
+        self.mm[offset + self.RECORD.size:payload_offset] = room_bytes
+        self.mm[payload_offset:end] = payload
+        self.write_offset = end
+        struct.pack_into("!Q", self.mm, 8, end) # Commit the record by moving the write offset
+        return (payload_offset, len(payload))
+
+    def get(self, handle):
+        offset, length = handle
+        return self.mm[offset:offset + length]
+
+    def load(self):
+        """Yields (room, seq, handle) for every record, oldest first."""
+        offset = self.HEADER.size
+        while offset < self.write_offset:
+            payload_length, room_length, seq = self.RECORD.unpack_from(self.mm, offset)
+            room_offset = offset + self.RECORD.size
+            room = self.mm[room_offset:room_offset + room_length].decode()
+            payload_offset = room_offset + room_length
+            yield room, seq, (payload_offset, payload_length)
+            offset = payload_offset + payload_length
+
+    def rewrite(self, entries):
+        """Replaces the log with entries [(room, seq, payload)], growing the file if they don't fit in half of it."""
+        needed = self.HEADER.size + sum(self.RECORD.size + len(room.encode()) + len(payload) for room, _, payload in entries)
+        capacity = self.capacity
+        while needed * 2 > capacity:
+            capacity *= 2
+        if capacity != self.capacity:
+            self.mm.resize(capacity)
+        self.write_offset = self.HEADER.size
+        self._write_header(self.history_id.encode())
+        return [self.put(room, seq, payload) for room, seq, payload in entries]
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
+
+class History:
+    """Ring buffers for the most recently used rooms, backed by a payload store."""
+    def __init__(self, size=HISTORY_SIZE, store=None, max_rooms=MAX_ROOMS, room_ttl=ROOM_TTL):
+        self.size = size
+        self.store = store if store is not None else MemoryStore()
+        self.max_rooms = max_rooms
+        self.room_ttl = room_ttl
+        self.rooms = OrderedDict() # Least recently used first
+        # Highest sequence number a dropped room reached. A room that comes back numbers
+        # on from there, so clients that remember an old seq still get the new messages.
+        self.dropped_seq = 0
+        for room, seq, handle in self.store.load():
+            self._room(room, seq).append(seq, handle)
+
+    @property
+    def history_id(self):
+        return self.store.history_id
+
+    def _room(self, room, first_seq=None):
+        """The history of room, marked as the most recently used one."""
+        history = self.rooms.get(room)
+        if history is None:
+            if len(self.rooms) >= self.max_rooms:
+                self._drop(next(iter(self.rooms)))
+            history = self.rooms[room] = RoomHistory(self.size, first_seq or self.dropped_seq + 1)
+        else:
+            self.rooms.move_to_end(room)
+            history.last_used = time.monotonic()
+        return history
+
+    def _drop(self, room):
+        history = self.rooms.pop(room)
+        self.dropped_seq = max(self.dropped_seq, history.next_seq - 1)
+
+    def prune(self, in_use):
+        """Drops the history of rooms not in in_use whose last message is older than room_ttl."""
+        cutoff = time.monotonic() - self.room_ttl
+        stale = []
+        for room, history in self.rooms.items():
+            if history.last_used > cutoff:
+                break # The rest were used more recently
+            if room not in in_use:
+                stale.append(room)
+        for room in stale:
+            self._drop(room)
+        return len(stale)
+
+    def last_seq(self, room):
+        history = self.rooms.get(room)
+        return history.next_seq - 1 if history else 0
+
+    def record(self, room, message_data):
+        """Assigns the room's next sequence number to message_data, stores it and returns the encoded payload."""
+        history = self._room(room)
+        seq = history.next_seq
+        message_data["seq"] = seq
+        payload = dumps_bytes(message_data)
+        try:
+            handle = self.store.put(room, seq, payload)
+        except LogFull:
+            self._compact()
+            handle = self.store.put(room, seq, payload)
+        history.append(seq, handle)
+        return payload
+
+    def _compact(self):
+        live = [
+            (room, seq, bytes(self.store.get(handle)))
+            for room, history in self.rooms.items()
+            for seq, handle in history.items()
+        ]
+        handles = iter(self.store.rewrite(live))
+        for history in self.rooms.values():
+            for seq, _ in history.items():
+                history.append(seq, next(handles))
+
+    def replay(self, room, since, history_id=None):
+        """
+        Builds one 'history' frame payload with the retained messages after seq since.
+        If history_id is not ours (e.g. another server process numbered the messages),
+        the sequence numbers can't be compared and everything retained is sent with reset set.
+        """
+        reset = history_id is not None and history_id != self.history_id
+        history = self.rooms.get(room)
+        handles = history.since(0 if reset else since) if history else []
+        messages = b",".join(bytes(self.store.get(handle)) for handle in handles)
+        header = dumps_bytes({
+            "type": "history", "room": room, "history_id": self.history_id,
+            "reset": reset, "last_seq": self.last_seq(room),
+        })
+        # Splice the stored payloads in as they are instead of decoding them again
+        return header[:-1] + b',"messages":[' + messages + b"]}"
+
+    def close(self):
+        self.store.close()
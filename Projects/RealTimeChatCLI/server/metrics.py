@@ -0,0 +1,162 @@
+# metrics.py
+# In-process metrics for the chat server, served in the Prometheus text format on a local
+# HTTP port (GET /metrics). Updating a counter or gauge is one attribute assignment and
+# a histogram observation is a bisect into a short list of bucket bounds, so they're cheap
+# enough for the broadcast path. Anything that can be read off the server's own state
+# (connected clients, log counters, queue depths) is computed only when scraped instead.
+import asyncio
+import bisect
+import math
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LOOP_LAG_INTERVAL = 0.5
+
+def exponential_buckets(start, factor, count):
+    return [start * factor ** i for i in range(count)]
+
+class Counter:
+    """A total that only goes up; function, if given, is read at scrape time instead."""
+    __slots__ = ("value", "function")
+    type = "counter"
+
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, name):
+        yield name, "", self.function() if self.function else self.value
+
+class Gauge(Counter):
+    """A value that goes up and down; function, if given, is read at scrape time instead."""
+    __slots__ = ()
+    type = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+class Histogram:
+    """Counts observations into buckets by upper bound, plus their count and sum."""
+    __slots__ = ("bounds", "counts", "sum")
+    type = "histogram"
+
+    def __init__(self, bounds):
+        self.bounds = sorted(bounds)
+        self.counts = [0] * (len(self.bounds) + 1) # The last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name):
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f"{name}_bucket", f'{{le="{format_value(bound)}"}}', cumulative
+        cumulative += self.counts[-1]
+        yield f"{name}_bucket", '{le="+Inf"}', cumulative
+        yield f"{name}_sum", "", self.sum
+        yield f"{name}_count", "", cumulative
+
+class HistogramSnapshot:
+    """A histogram of values read at scrape time, e.g. one value per connected client."""
+    __slots__ = ("bounds", "function")
+    type = "histogram"
+
+    def __init__(self, bounds, function):
+        self.bounds = bounds
+        self.function = function
+
+    def samples(self, name):
+        histogram = Histogram(self.bounds)
+        for value in self.function():
+            histogram.observe(value)
+        return histogram.samples(name)
+
+class Family:
+    """Labelled series computed at scrape time: function returns {label value: value}."""
+    __slots__ = ("type", "label", "function")
+
+    def __init__(self, type, label, function):
+        self.type = type
+        self.label = label
+        self.function = function
+
+    def samples(self, name):
+        for label_value, value in sorted(self.function().items()):
+            yield name, f'{{{self.label}="{escape_label(str(label_value))}"}}', value
+
+class Registry:
+    def __init__(self):
+        self.metrics = {} # name -> (help, metric), in registration order
+
+    def register(self, name, help, metric):
+        self.metrics[name] = (help, metric)
+        return metric
+
+    def counter(self, name, help, function=None):
+        return self.register(name, help, Counter(function))
+
+    def gauge(self, name, help, function=None):
+        return self.register(name, help, Gauge(function))
+
+    def histogram(self, name, help, bounds, function=None):
+        """A histogram to observe into, or with function, one of the values function returns when scraped."""
+        return self.register(name, help, HistogramSnapshot(bounds, function) if function else Histogram(bounds))
+
+    def family(self, name, help, type, label, function):
+        return self.register(name, help, Family(type, label, function))
+
+    def render(self):
+        lines = []
+        for name, (help, metric) in self.metrics.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for sample_name, labels, value in metric.samples(name):
+                lines.append(f"{sample_name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+async def watch_loop_lag(histogram, gauge, interval=LOOP_LAG_INTERVAL):
+    """Measures how late the event loop wakes a sleeping task: the time every other callback has to wait too."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        histogram.observe(lag)
+        gauge.set(lag)
+
+async def serve_metrics(registry, host="127.0.0.1", port=9100):
+    """Starts a minimal HTTP server answering GET /metrics with registry.render()."""
+    async def handle(reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            method, path, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+            if method == "GET" and path.split("?", 1)[0] == "/metrics":
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Try /metrics\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,88 @@
+# redis_standin.py
+# A tiny local stand-in for Redis pub/sub, for running the chat server's redis bus
+# backend without a Redis install. Supports PING, PUBLISH, SUBSCRIBE and PSUBSCRIBE.
+#
+# Usage: python redis_standin.py --port 6379
+import argparse
+import asyncio
+import fnmatch
+
+class Subscriber:
+    def __init__(self, writer):
+        self.writer = writer
+        self.channels = set()
+        self.patterns = set()
+
+def bulk(value: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+def array(*items: bytes) -> bytes:
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+async def read_command(reader):
+    """Reads one RESP array of bulk strings, or an inline command."""
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()
+    parts = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        parts.append((await reader.readexactly(length + 2))[:-2])
+    return parts
+
+async def serve(host, port):
+    subscribers = set()
+
+    def publish(channel, data):
+        receivers = 0
+        text_channel = channel.decode(errors="replace")
+        for subscriber in subscribers:
+            if channel in subscriber.channels:
+                subscriber.writer.write(array(bulk(b"message"), bulk(channel), bulk(data)))
+                receivers += 1
+            for pattern in subscriber.patterns:
+                if fnmatch.fnmatchcase(text_channel, pattern.decode(errors="replace")):
+                    subscriber.writer.write(array(bulk(b"pmessage"), bulk(pattern), bulk(channel), bulk(data)))
+                    receivers += 1
+        return receivers
+
+    async def handle(reader, writer):
+        subscriber = Subscriber(writer)
+        subscribers.add(subscriber)
+        try:
+            while (command := await read_command(reader)) is not None:
+                if not command:
+                    continue
+                name = command[0].upper()
+                if name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == b"PUBLISH" and len(command) == 3:
+                    writer.write(b":%d\r\n" % publish(command[1], command[2]))
+                elif name in (b"SUBSCRIBE", b"PSUBSCRIBE") and len(command) > 1:
+                    target = subscriber.channels if name == b"SUBSCRIBE" else subscriber.patterns
+                    for channel in command[1:]:
+                        target.add(channel)
+                        count = len(subscriber.channels) + len(subscriber.patterns)
+                        writer.write(array(bulk(name.lower()), bulk(channel), b":%d\r\n" % count))
+                else:
+                    writer.write(b"-ERR unsupported command '%s'\r\n" % name)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            subscribers.discard(subscriber)
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Redis stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal Redis pub/sub stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
@@ -1,62 +1,650 @@
+import argparse
 import asyncio
+import heapq
+import http
+import multiprocessing
+import os
+import signal
+import sys
+import time
 import websockets
-import json
+from collections import deque
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from websockets.protocol import State
 
-# This set will store all connected WebSocket clients.
-connected_clients = set()
+# Modules shared by the chat servers and the client live in RealTimeChatCLI/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from fastjson import dumps_bytes, loads
+from frames import PreparedMessage, shareable_deflate
+from bus import create_bus, run_broker
+from chatlog import Logger, add_log_arguments, logger_from_args
+from history import HISTORY_SIZE, MAX_ROOMS, ROOM_TTL, History, MmapLog
+from liveness import TimingWheel, TokenBucket
+from metrics import Registry, exponential_buckets, serve_metrics, watch_loop_lag
+
+# Outbound queue settings. Every client gets its own bounded queue of encoded frames,
+# drained by a writer task, so a slow client never delays the sender or other clients.
+SEND_QUEUE_SIZE = 256
+OVERFLOW_POLICY = "drop_oldest" # 'drop_oldest', 'coalesce' or 'disconnect'
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+FANOUT_BATCH = 1000 # Yield to the event loop after enqueueing to this many clients
+# The 'coalesce' policy folds a full queue into one batch frame of at most this many messages
+# and bytes; a client that falls further behind is disconnected as a slow consumer.
+MAX_COALESCED_MESSAGES = 4096
+MAX_COALESCED_BYTES = 1024 * 1024
+
+# Rooms. Every client starts in DEFAULT_ROOM, so plain-text clients keep chatting
+# with everyone; clients that only care about some rooms can leave it.
+DEFAULT_ROOM = "lobby"
+MAX_ROOMS_PER_CLIENT = 100
+MAX_ROOM_NAME_LENGTH = 64
+MAX_BATCH_REQUESTS = 1000 # Requests a client may coalesce into one 'batch' frame
+
+# How queued messages are written. 'prepared' frames each message once and writes the same
+# bytes to every connection; 'per_client' goes through websocket.send for every client.
+FRAME_MODE = "prepared"
+FRAME_MODES = ("prepared", "per_client")
+# 'none' disables permessage-deflate; 'shared' negotiates it without server context
+# takeover so each broadcast is compressed once and shared by all connections.
+COMPRESSION = "none"
+COMPRESSION_MODES = ("none", "shared")
+
+# Liveness. Clients we haven't heard from for HEARTBEAT_INTERVAL seconds are pinged, and
+# those still silent after IDLE_TIMEOUT are dropped, which clears out half-open connections.
+# All of it is driven by one timing wheel instead of a keepalive timer per connection.
+HEARTBEAT_INTERVAL = 30.0
+IDLE_TIMEOUT = 90.0
+# Admission. Beyond MAX_CONNECTIONS new connections wait in their opening handshake
+# for a free slot, and get HTTP 503 if none frees up within ADMISSION_TIMEOUT.
+MAX_CONNECTIONS = 10000
+ADMISSION_TIMEOUT = 5.0
+# Inbound rate limit per client (requests per second, burst). A client over its limit isn't
+# read from until it's back under, so a flooder is slowed down by TCP flow control. Every
+# request in a batch counts, so batching saves frames but doesn't raise the limit; clients
+# are told the limit in their your_id message and client.py paces itself to it. Start the
+# server with a higher --rate-limit (or 0) to use the client as a load generator.
+RATE_LIMIT = 200.0
+RATE_BURST = 400
+
+# Prometheus metrics on http://METRICS_HOST:<--metrics-port>/metrics, off unless a port is given.
+# Worker processes serve theirs on consecutive ports from there.
+METRICS_HOST = "127.0.0.1"
+BACKLOGGED_CLIENTS = 10 # Clients with the most bytes waiting, reported individually
+
+# Log lines per event category: (fraction of events written, max lines per second, 0 for
+# no limit). Per-message events are only counted by default; the counts go out in a stats
+# line every --log-stats-interval seconds. See chatlog.py.
+LOG_CATEGORIES = {
+    "server": (1.0, 0.0),
+    "connect": (1.0, 20.0),
+    "disconnect": (1.0, 20.0),
+    "receive": (0.0, 20.0),
+    "publish": (0.0, 20.0),
+    "slow_consumer": (1.0, 10.0),
+    "idle_drop": (1.0, 10.0),
+    "error": (1.0, 10.0),
+    "bus_error": (1.0, 1.0),
+}
+
+class CoalescedBatch(PreparedMessage):
+    """A batch frame folded from queued messages; keeps its parts so it can be folded again flat."""
+    __slots__ = ("parts",)
+
+    def __init__(self, parts):
+        super().__init__(b'{"type":"batch","messages":[' + b",".join(parts) + b"]}")
+        self.parts = parts
+
+class ClientConnection:
+    """A connected client with its own bounded outbound queue and writer task."""
+    def __init__(self, websocket, queue_size=SEND_QUEUE_SIZE, overflow_policy=OVERFLOW_POLICY, frame_mode=FRAME_MODE):
+        self.websocket = websocket
+        self.queue = deque() # PreparedMessage objects waiting to be written
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.frame_mode = frame_mode
+        self.deflate = shareable_deflate(websocket)
+        self.rooms = set() # Reverse index: the rooms this client is subscribed to
+        now = asyncio.get_running_loop().time()
+        self.last_seen = now # When we last heard from the client, for the heartbeat checks
+        self.pinging = False
+        self.rate_limit = TokenBucket(rate_limit, rate_burst, now) if rate_limit > 0 else None
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.closing = False
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def enqueue(self, message: PreparedMessage):
+        """Queues a prepared message without blocking. Applies the overflow policy when full."""
+        if self.closing:
+            return
+        if len(self.queue) >= self.queue_size:
+            if self.overflow_policy == "disconnect":
+                self.disconnect_slow_consumer()
+                return
+            if self.overflow_policy == "coalesce":
+                # Fold everything pending into a single batch frame; the payloads are JSON already.
+                # Earlier batches are spliced in rather than nested, and the result is capped.
+                parts = []
+                for pending in self.queue:
+                    parts.extend(pending.parts if isinstance(pending, CoalescedBatch) else (pending.payload,))
+                if len(parts) > MAX_COALESCED_MESSAGES or sum(map(len, parts)) > MAX_COALESCED_BYTES:
+                    self.disconnect_slow_consumer()
+                    return
+                self.queue.clear()
+                self.queue.append(CoalescedBatch(parts))
+            else:
+                self.queue.popleft()
+                self.dropped += 1
+                messages_dropped.inc()
+        self.queue.append(message)
+        self.wakeup.set()
+
+    def disconnect_slow_consumer(self):
+        self.closing = True
+        self.queue.clear()
+        log.log("slow_consumer", "Client %s is too slow, disconnecting.", self.websocket.remote_address)
+        spawn(self.websocket.close(code=1008, reason="slow consumer"))
+
+    async def _writer(self):
+        websocket = self.websocket
+        try:
+            while True:
+                while not self.queue:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                if self.frame_mode == "per_client":
+                    await websocket.send(self.queue.popleft().payload.decode())
+                    continue
+                if websocket.protocol.state is not State.OPEN:
+                    return # The handler notices the closed connection and unregisters the client
+                # Everything queued goes out in one write; the frames were built once per broadcast
+                frames = [message.frame(self.deflate) for message in self.queue]
+                self.queue.clear()
+                websocket.transport.writelines(frames)
+                await websocket.drain()
+        except websockets.exceptions.ConnectionClosed:
+            pass # The handler notices the closed connection and unregisters the client
+
+    async def ping(self):
+        """Pings the client; its pong counts as hearing from it."""
+        self.pinging = True
+        try:
+            pong_waiter = await self.websocket.ping()
+            await pong_waiter
+            self.last_seen = asyncio.get_running_loop().time()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.pinging = False
+
+    def close(self):
+        self.closing = True
+        self.writer_task.cancel()
+
+# Fire-and-forget tasks (closes, pings), referenced until they finish so they aren't garbage collected.
+background_tasks = set()
+
+def spawn(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# Maps each connected WebSocket to its ClientConnection.
+connected_clients = {}
+# Maps each room name to the set of ClientConnections subscribed to it.
+room_subscribers = {}
+# Pub/sub bus shared with the other server processes, if running more than one.
+bus = None
+# Recent messages of every room, for clients catching up after a reconnect.
+history = History(HISTORY_SIZE)
+# Writes log lines from a background thread; started by main() in every server process.
+log = Logger(LOG_CATEGORIES)
+# Turns once a second and runs the heartbeat checks that are due (see check_liveness).
+liveness_wheel = None
+# One slot per connection allowed at a time; taken before the handshake completes.
+connection_slots = None
+metrics_host = METRICS_HOST
+metrics_port = 0
+queue_size = SEND_QUEUE_SIZE
+overflow_policy = OVERFLOW_POLICY
+frame_mode = FRAME_MODE
+compression = COMPRESSION
+heartbeat_interval = HEARTBEAT_INTERVAL
+idle_timeout = IDLE_TIMEOUT
+max_connections = MAX_CONNECTIONS
+rate_limit = RATE_LIMIT
+rate_burst = RATE_BURST
+
+def client_backlog(client):
+    """Bytes waiting to go out to a client: queued frames plus the transport's write buffer."""
+    return sum(len(message.payload) for message in client.queue) + client.websocket.transport.get_write_buffer_size()
+
+def most_backlogged():
+    backlogs = ((client_backlog(client), str(client.websocket.remote_address)) for client in connected_clients.values())
+    return {address: backlog for backlog, address in heapq.nlargest(BACKLOGGED_CLIENTS, backlogs) if backlog}
+
+# What can be read off the server's state or the log counters is computed when scraped, so
+# the hot paths only pay for the fan-out timing and the overflow counter.
+metrics = Registry()
+metrics.gauge("chat_connected_clients", "Clients connected to this process", lambda: len(connected_clients))
+metrics.gauge("chat_rooms", "Rooms with at least one local subscriber", lambda: len(room_subscribers))
+metrics.counter("chat_connects_total", "Connections opened", lambda: log.counters.get("connect", 0))
+metrics.counter("chat_disconnects_total", "Connections closed", lambda: log.counters.get("disconnect", 0))
+metrics.counter("chat_messages_received_total", "Frames received from clients", lambda: log.counters.get("receive", 0))
+metrics.counter("chat_messages_published_total", "Chat messages delivered to a room", lambda: log.counters.get("publish", 0))
+metrics.counter("chat_messages_sent_total", "Chat messages queued for a client", lambda: log.counters.get("delivered", 0))
+messages_dropped = metrics.counter("chat_messages_dropped_total", "Queued messages dropped by the overflow policy")
+metrics.counter("chat_slow_consumers_total", "Clients disconnected for falling behind", lambda: log.counters.get("slow_consumer", 0))
+metrics.counter("chat_idle_drops_total", "Clients dropped for not answering heartbeats", lambda: log.counters.get("idle_drop", 0))
+metrics.counter("chat_bus_publish_errors_total", "Messages that could not be handed to the bus", lambda: log.counters.get("bus_error", 0))
+fanout_seconds = metrics.histogram(
+    "chat_broadcast_fanout_seconds", "Time to queue a message for every local subscriber of its room",
+    exponential_buckets(0.00001, 4, 10),
+)
+metrics.histogram(
+    "chat_client_send_queue_depth", "Messages waiting in each client's send queue",
+    [0, 1, 4, 16, 64, 256, 1024], lambda: (len(client.queue) for client in connected_clients.values()),
+)
+metrics.histogram(
+    "chat_client_backlog_bytes", "Bytes waiting to be written to each client",
+    exponential_buckets(1024, 4, 8), lambda: map(client_backlog, connected_clients.values()),
+)
+metrics.family(
+    "chat_client_backlog_top_bytes", f"Bytes waiting for the {BACKLOGGED_CLIENTS} most backlogged clients",
+    "gauge", "client", most_backlogged,
+)
+loop_lag_seconds = metrics.histogram(
+    "chat_event_loop_lag_seconds", "How late the event loop wakes a sleeping task", exponential_buckets(0.0001, 4, 9),
+)
+loop_lag = metrics.gauge("chat_event_loop_lag_last_seconds", "Event loop lag at the last measurement")
+
+async def prune_history():
+    """Drops the history of rooms that have had no subscribers here and no messages for a while."""
+    while True:
+        await asyncio.sleep(min(60.0, history.room_ttl))
+        dropped = history.prune(room_subscribers)
+        if dropped:
+            log.log("server", "Dropped the history of %d idle rooms", dropped)
+
+def history_position(room):
+    """Latest sequence number of room and the id of the history numbering it (None if history is off)."""
+    if not history:
+        return {"seq": 0, "history_id": None}
+    return {"seq": history.last_seq(room), "history_id": history.history_id}
 
 async def register(websocket):
-    """Adds a new client to the set of connected clients and sends them their ID."""
-    connected_clients.add(websocket)
+    """Adds a new client to the connected clients and sends them their ID."""
+    client = ClientConnection(websocket, queue_size, overflow_policy, frame_mode)
+    connected_clients[websocket] = client
     # Send the client its own unique ID (its remote address as seen by the server)
-    await websocket.send(json.dumps({"type": "your_id", "id": str(websocket.remote_address)}))
-    print(f"Client {websocket.remote_address} connected. Total clients: {len(connected_clients)}")
+    # and where the lobby's history stands, so it can ask for what it missed later
+    client.enqueue(PreparedMessage(dumps_bytes({
+        "type": "your_id", "id": str(websocket.remote_address), "room": DEFAULT_ROOM, **history_position(DEFAULT_ROOM),
+        "rate_limit": rate_limit, "rate_burst": rate_burst,
+    })))
+    join_room(client, DEFAULT_ROOM)
+    if liveness_wheel is not None:
+        liveness_wheel.schedule(client, heartbeat_interval)
+    log.log("connect", "Client %s connected. Total clients: %d", websocket.remote_address, len(connected_clients))
 
 async def unregister(websocket):
-    """Removes a client from the set of connected clients."""
-    connected_clients.remove(websocket)
-    print(f"Client {websocket.remote_address} disconnected. Total clients: {len(connected_clients)}")
-
-async def broadcast(message_data):
-    """Sends a structured message (JSON) to all connected clients."""
-    if connected_clients:
-        # Convert the message_data dictionary to a JSON string
-        json_message = json.dumps(message_data)
-        await asyncio.gather(*[client.send(json_message) for client in connected_clients])
-        print(f"Broadcasted: {json_message}")
+    """Removes a client from the connected clients and its rooms, and stops its writer."""
+    client = connected_clients.pop(websocket)
+    # Only the client's own rooms are touched, not every room on the server
+    for room in list(client.rooms):
+        leave_room(client, room)
+    client.close()
+    log.log("disconnect", "Client %s disconnected. Total clients: %d", websocket.remote_address, len(connected_clients))
+
+def join_room(client, room):
+    room_subscribers.setdefault(room, set()).add(client)
+    client.rooms.add(room)
+
+def leave_room(client, room):
+    client.rooms.discard(room)
+    subscribers = room_subscribers.get(room)
+    if subscribers is not None:
+        subscribers.discard(client)
+        if not subscribers:
+            del room_subscribers[room] # Don't keep empty rooms around
+
+def send_to(client, message_data):
+    """Queues a message for a single client."""
+    client.enqueue(PreparedMessage(dumps_bytes(message_data)))
+
+async def publish(room, message_data):
+    """
+    Encodes a structured message (JSON) once, queues it for every local subscriber of room
+    and hands it to the bus so the other server processes deliver it to theirs. While the
+    bus is down (it reconnects by itself) the message only reaches this process's clients.
+    """
+    payload = history.record(room, message_data) if history else dumps_bytes(message_data)
+    await deliver_local(room, payload)
+    if bus is not None:
+        try:
+            await bus.publish(room, payload)
+        except OSError as e: # ConnectionError included
+            log.log("bus_error", "Could not publish to the bus: %s", e)
+
+async def deliver_from_bus(room, payload):
+    """Delivers a message published by another server process, numbered in this process's history."""
+    if history:
+        payload = history.record(room, loads(payload))
+    await deliver_local(room, payload)
+
+async def deliver_local(room, payload):
+    """Queues an encoded message for the subscribers of room connected to this process."""
+    subscribers = room_subscribers.get(room)
+    if subscribers:
+        started = time.perf_counter()
+        # The frame is built lazily by the first writer and then shared
+        message = PreparedMessage(payload)
+        # Iterate over a snapshot: clients may join or leave while we yield below
+        clients = list(subscribers)
+        for start in range(0, len(clients), FANOUT_BATCH):
+            for client in clients[start:start + FANOUT_BATCH]:
+                client.enqueue(message)
+            if start + FANOUT_BATCH < len(clients):
+                await asyncio.sleep(0)
+        fanout_seconds.observe(time.perf_counter() - started)
+        log.log("publish", "Published to %s: %s", room, message.payload)
+        log.count("delivered", len(clients))
+
+def parse_request(message_text):
+    """
+    Turns an incoming frame into a request dict. JSON objects with a 'type' are requests
+    (join, leave, publish, replay, or a batch of these); anything else is plain text for the default room.
+    """
+    if message_text[:1] in ("{", b"{"):
+        try:
+            request = loads(message_text)
+        except ValueError:
+            request = None
+        if isinstance(request, dict) and "type" in request:
+            return request
+    if isinstance(message_text, bytes):
+        message_text = message_text.decode(errors="replace")
+    return {"type": "publish", "room": DEFAULT_ROOM, "message": message_text}
+
+def valid_room(room):
+    return isinstance(room, str) and 0 < len(room) <= MAX_ROOM_NAME_LENGTH
+
+async def handle_batch(client, request):
+    """Handles the requests a client coalesced into one frame, in order."""
+    requests = request.get("requests")
+    if not isinstance(requests, list) or len(requests) > MAX_BATCH_REQUESTS:
+        send_to(client, {"type": "error", "message": f"A batch holds a list of at most {MAX_BATCH_REQUESTS} requests"})
+        return
+    for inner_request in requests:
+        if isinstance(inner_request, dict) and inner_request.get("type") != "batch":
+            await handle_request(client, inner_request)
+            # Like after every frame in handler(): a whole batch at once would queue up to
+            # MAX_BATCH_REQUESTS frames per subscriber, more than their send queues hold
+            await asyncio.sleep(0)
+
+async def handle_request(client, request):
+    request_type = request.get("type")
+    if request_type == "batch":
+        await handle_batch(client, request)
+        return
+    room = request.get("room", DEFAULT_ROOM)
+    if not valid_room(room):
+        send_to(client, {"type": "error", "message": f"Invalid room name: {room!r}", "room": room})
+        return
+
+    if request_type == "join":
+        if room not in client.rooms and len(client.rooms) >= MAX_ROOMS_PER_CLIENT:
+            send_to(client, {"type": "error", "message": f"Cannot join more than {MAX_ROOMS_PER_CLIENT} rooms", "room": room})
+            return
+        join_room(client, room)
+        send_to(client, {"type": "joined", "room": room, **history_position(room)})
+    elif request_type == "leave":
+        leave_room(client, room)
+        send_to(client, {"type": "left", "room": room})
+    elif request_type == "publish":
+        if room not in client.rooms:
+            send_to(client, {"type": "error", "message": f"Join {room} before publishing to it", "room": room})
+            return
+        # Prepare the message data to be published
+        await publish(room, {
+            "type": "chat_message",
+            "room": room,
+            "sender_id": str(client.websocket.remote_address), # Identify the sender
+            "message": str(request.get("message", "")),
+        })
+    elif request_type == "replay":
+        # Everything after 'since' that is still retained, as one batched frame
+        if room not in client.rooms:
+            send_to(client, {"type": "error", "message": f"Join {room} before requesting its history", "room": room})
+        elif not history:
+            send_to(client, {"type": "error", "message": "Message history is disabled on this server", "room": room})
+        else:
+            since = request.get("since", 0)
+            since = since if isinstance(since, int) else 0
+            client.enqueue(PreparedMessage(history.replay(room, since, request.get("history_id"))))
+    else:
+        send_to(client, {"type": "error", "message": f"Unknown request type: {request_type!r}"})
+
+def check_liveness(client):
+    """Runs when a client's heartbeat check comes round on the wheel: ping it, drop it, or check again later."""
+    if client.closing:
+        return # Unregistered meanwhile; dropping it from the wheel is all that's left
+    idle = asyncio.get_running_loop().time() - client.last_seen
+    if idle >= idle_timeout:
+        log.log("idle_drop", "Client %s sent nothing for %.0fs, dropping it.", client.websocket.remote_address, idle)
+        client.close()
+        client.websocket.transport.abort() # Half-open peers would never answer a close frame
+        return
+    if idle >= heartbeat_interval:
+        if not client.pinging:
+            spawn(client.ping())
+        liveness_wheel.schedule(client, idle_timeout - idle)
+    else:
+        liveness_wheel.schedule(client, heartbeat_interval - idle)
+
+async def admit(connection, request):
+    """
+    Handshake hook: holds a new connection until one of the max_connections slots is
+    free, so a burst of clients waits instead of piling onto the server.
+    """
+    try:
+        await asyncio.wait_for(connection_slots.acquire(), ADMISSION_TIMEOUT)
+    except asyncio.TimeoutError:
+        response = connection.respond(http.HTTPStatus.SERVICE_UNAVAILABLE, "Server is full, try again later.\n")
+        response.headers["Retry-After"] = "10"
+        return response
+    # The slot is freed when the TCP connection goes away, whatever happens in between
+    connection.connection_lost_waiter.add_done_callback(lambda _: connection_slots.release())
+    return None
+
+def request_cost(request):
+    """How many rate limit tokens a request takes: a batch costs one per request in it."""
+    if request.get("type") == "batch" and isinstance(request.get("requests"), list):
+        return max(1, len(request["requests"]))
+    return 1
 
 async def handler(websocket):
     """
     This is the main handler function for each new WebSocket connection.
-    It registers the client, listens for messages, and broadcasts them in JSON format.
+    It registers the client, listens for requests, and publishes chat messages to rooms in JSON format.
     """
     await register(websocket)
+    client = connected_clients[websocket]
 
     try:
         async for message_text in websocket:
-            print(f"Received from {websocket.remote_address}: {message_text}")
-            # Prepare the message data to be broadcasted
-            message_to_broadcast = {
-                "type": "chat_message",
-                "sender_id": str(websocket.remote_address), # Identify the sender
-                "message": message_text
-            }
-            await broadcast(message_to_broadcast)
+            log.log("receive", "Received from %s: %s", websocket.remote_address, message_text)
+            now = asyncio.get_running_loop().time()
+            client.last_seen = now
+            request = parse_request(message_text)
+            if client.rate_limit is not None:
+                delay = client.rate_limit.delay(now, request_cost(request))
+                if delay:
+                    await asyncio.sleep(delay) # Not reading meanwhile pushes back on the client
+            await handle_request(client, request)
+            # Frames already received come out of the loop above without yielding; let the
+            # writer tasks flush what this one queued before the next overflows their queues
+            await asyncio.sleep(0)
     except websockets.exceptions.ConnectionClosedOK:
-        print(f"Client {websocket.remote_address} disconnected gracefully.")
+        pass # Logged as a disconnect by unregister
     except Exception as e:
-        print(f"An unexpected error occurred with client {websocket.remote_address}: {e}")
+        log.log("error", "An unexpected error occurred with client %s: %s", websocket.remote_address, e)
     finally:
         await unregister(websocket)
 
-async def main():
+async def main(host="0.0.0.0", port=8765, message_bus=None, reuse_port=False):
     """
     This function starts the WebSocket server.
-    It listens on all available interfaces (0.0.0.0) on port 8765.
+    By default it listens on all available interfaces (0.0.0.0) on port 8765.
+    With reuse_port, several processes can listen on the same port (SO_REUSEPORT)
+    and the kernel spreads new connections between them.
     """
-    async with websockets.serve(handler, "0.0.0.0", 8765):
-        print("WebSocket chat server started on ws://0.0.0.0:8765")
-        await asyncio.Future()  # run forever
+    global bus, liveness_wheel, connection_slots
+    if message_bus is not None:
+        await message_bus.connect(deliver_from_bus)
+        bus = message_bus
+    if idle_timeout > 0:
+        liveness_wheel = TimingWheel(check_liveness)
+        liveness_wheel.start()
+    connection_slots = asyncio.Semaphore(max_connections)
+    log.start()
+    metrics_server = lag_watcher = history_pruner = None
+    if history:
+        history_pruner = asyncio.create_task(prune_history())
+    if metrics_port:
+        metrics_server = await serve_metrics(metrics, metrics_host, metrics_port)
+        lag_watcher = asyncio.create_task(watch_loop_lag(loop_lag_seconds, loop_lag))
+        log.log("server", "Metrics on http://%s:%s/metrics", metrics_host, metrics_port)
+
+    if compression == "shared":
+        extensions = [ServerPerMessageDeflateFactory(server_no_context_takeover=True)]
+    else:
+        extensions = None
+    try:
+        async with websockets.serve(
+            handler, host, port, compression=None, extensions=extensions, reuse_port=reuse_port,
+            process_request=admit, ping_interval=None, # Heartbeats come from the liveness wheel
+            backlog=1024,
+        ):
+            log.log("server", "WebSocket chat server started on ws://%s:%s", host, port)
+            await asyncio.Future()  # run forever
+    finally:
+        if liveness_wheel is not None:
+            liveness_wheel.stop()
+        if metrics_server is not None:
+            lag_watcher.cancel()
+            metrics_server.close()
+        if history_pruner is not None:
+            history_pruner.cancel()
+        if history:
+            history.close() # Flushes the history log, if there is one
+        log.stop()
+
+def run_worker(args, index=0):
+    """Entry point of one server process in multi-process mode."""
+    configure(args, index)
+    message_bus = create_bus(args.bus, args.bus_path, args.redis_url)
+    try:
+        asyncio.run(main(args.host, args.port, message_bus, reuse_port=True))
+    except KeyboardInterrupt:
+        pass
+
+async def run_cluster(args):
+    """Starts the bus broker (for the unix backend) and args.workers server processes sharing one port."""
+    broker = await run_broker(args.bus_path) if args.bus == "unix" else None
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args, index), daemon=True) for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    print(f"Started {args.workers} server processes on port {args.port} with the {args.bus} bus")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            await asyncio.to_thread(process.join)
+        if broker is not None:
+            broker.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="WebSocket chat server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--queue-size", type=int, default=SEND_QUEUE_SIZE, help="outbound frames buffered per client")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default=OVERFLOW_POLICY,
+                        help="what to do when a client's outbound queue is full")
+    parser.add_argument("--frame-mode", choices=FRAME_MODES, default=FRAME_MODE,
+                        help="frame each broadcast once ('prepared') or once per client")
+    parser.add_argument("--compression", choices=COMPRESSION_MODES, default=COMPRESSION)
+    parser.add_argument("--workers", type=int, default=1, help="server processes sharing the port")
+    parser.add_argument("--bus", choices=("none", "unix", "redis"), default="none",
+                        help="pub/sub backend between processes (default: unix when --workers > 1)")
+    parser.add_argument("--bus-path", help="Unix socket of the built-in broker (default /tmp/chat-bus-<port>.sock)")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379", help="Redis (or redis_standin.py) for --bus redis")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL,
+                        help="ping clients silent for this many seconds")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="drop clients silent for this many seconds, 0 to never drop them")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS, help="per server process")
+    parser.add_argument("--rate-limit", type=float, default=RATE_LIMIT,
+                        help="requests per second read from each client (each one in a batch counts), 0 for no limit")
+    parser.add_argument("--rate-burst", type=int, default=RATE_BURST)
+    parser.add_argument("--history-size", type=int, default=HISTORY_SIZE, help="messages kept per room, 0 to disable")
+    parser.add_argument("--history-rooms", type=int, default=MAX_ROOMS,
+                        help="rooms whose history is kept, the least recently used one is dropped first")
+    parser.add_argument("--history-ttl", type=float, default=ROOM_TTL,
+                        help="seconds the history of a room nobody is in is kept after its last message")
+    parser.add_argument("--history-log", help="memory-mapped log file that keeps the history across restarts")
+    parser.add_argument("--metrics-host", default=METRICS_HOST)
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="serve Prometheus metrics on this port (the next ones for further workers), 0 for off")
+    add_log_arguments(parser)
+    args = parser.parse_args()
+    if args.bus == "none" and args.workers > 1:
+        args.bus = "unix"
+    if args.bus_path is None:
+        args.bus_path = f"/tmp/chat-bus-{args.port}.sock"
+    return args
+
+def configure(args, index=0):
+    """Applies command line settings to the module-level configuration of server process index."""
+    global queue_size, overflow_policy, frame_mode, compression, history, log
+    global heartbeat_interval, idle_timeout, max_connections, rate_limit, rate_burst, metrics_host, metrics_port
+    queue_size = args.queue_size
+    overflow_policy = args.overflow
+    frame_mode = args.frame_mode
+    compression = args.compression
+    heartbeat_interval = args.heartbeat_interval
+    idle_timeout = args.idle_timeout
+    max_connections = args.max_connections
+    rate_limit = args.rate_limit
+    rate_burst = args.rate_burst
+    log = logger_from_args(LOG_CATEGORIES, args)
+    metrics_host = args.metrics_host
+    metrics_port = args.metrics_port + index if args.metrics_port else 0
+
+    history = None
+    if args.history_size > 0:
+        store = None
+        if args.history_log:
+            # Every process numbers messages on its own, so each one keeps its own log
+            store = MmapLog(args.history_log if args.workers == 1 else f"{args.history_log}.{index}")
+        history = History(args.history_size, store, args.history_rooms, args.history_ttl)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    if args.workers > 1 or args.bus == "unix":
+        asyncio.run(run_cluster(args)) # The built-in broker lives in this parent process
+    elif args.bus == "redis":
+        run_worker(args) # A single process joining other servers through Redis
+    else:
+        configure(args)
+        asyncio.run(main(args.host, args.port))